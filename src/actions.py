@@ -59,7 +59,7 @@ class PickupAction(Action):
         if len(le) > 0:
             item = entities_sorted_for_retrieval[0]
 
-            self.engine.game_map.entities.remove(item)
+            self.engine.game_map.remove_entity(item)
             item.parent = self.entity.inventory
             inventory.items.append(item)
 
@@ -112,12 +112,28 @@ class EquipAction(Action):
 class WaitAction(Action):
     def perform(self) -> None:
         dest_x, dest_y = (self.engine.player.x, self.engine.player.y,)
-        if (self.performedByPlayer and self.engine.game_map.tiles["fall_through"][dest_x, dest_y]):
+        if (self.performedByPlayer and self.engine.game_map.fall_through[dest_x, dest_y]):
             self.entity.move_to(*self.engine.game_map.downstairs_location)
             self.engine.descend(new_stairs=False, reposition=(dest_x, dest_y,))
             return
 
 
+class RestAction(Action):
+    """Wait up to `turns` turns in a row, stopping once something comes into view or the player is hurt."""
+
+    def __init__(self, entity: Actor, performedByPlayer: bool, turns: int):
+        super().__init__(entity, performedByPlayer)
+
+        self.turns = turns
+
+    def perform(self) -> None:
+        if self.engine.is_actor_in_view():
+            raise exceptions.Impossible("You can't rest with someone in view.")
+        # The last turn passes as it does after any action.
+        turns = self.engine.fast_forward(self.turns - 1) + 1
+        self.engine.message_log.add_message(f"You rest for {turns} turns.")
+
+
 class TakeStairsDownAction(Action):
     def perform(self) -> None:
         """
@@ -188,6 +204,8 @@ class MeleeAction(ActionWithDirection):
             damage = 0
             miss = True
 
+        self.engine.make_noise(target.x, target.y, NOISE_MELEE)
+
         attack_desc = f"{self.entity.title.capitalize()}{self.entity.name} attacks {target.title}{target.name}"
         attack_color = color.player_atk if self.entity is self.engine.player else color.enemy_atk
 
@@ -211,7 +229,7 @@ class MovementAction(ActionWithDirection):
         dest_x, dest_y = self.dest_xy
 
         if self.performedByPlayer:
-            if self.engine.game_map.tiles["fall_through"][dest_x, dest_y]:
+            if self.engine.game_map.fall_through[dest_x, dest_y]:
                 self.entity.move_to(*self.engine.game_map.downstairs_location)
                 self.engine.descend(new_stairs=False, reposition=(dest_x, dest_y,))
                 return
@@ -224,7 +242,7 @@ class MovementAction(ActionWithDirection):
         if not self.engine.game_map.in_bounds(dest_x, dest_y):
             # Destination is out of bounds.
             raise exceptions.Impossible("That way is blocked.")
-        if not self.engine.game_map.tiles["walkable"][dest_x, dest_y]:
+        if not self.engine.game_map.walkable[dest_x, dest_y]:
             # Destination is blocked by a tile.
             raise exceptions.Impossible("That way is blocked.")
         if self.engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Actor
+    from game_map import GameMap
+
+
+ACTIVE = 0  # Acts at its normal speed.
+IDLE = 1  # Acts IDLE_INTERVAL times less often.
+DORMANT = 2  # Doesn't act until something wakes it up.
+
+ACTIVE_RADIUS = 10  # Actors this close to the player, or in view, are active.
+IDLE_RADIUS = 24  # Actors this close to the player are idle, further away they are dormant.
+IDLE_INTERVAL = 4
+WAKE_DURATION = 20  # Turns an actor woken up by noise stays active for.
+
+
+class ActivityScheduler:
+    """
+    Sorts the actors on the current map into activity tiers so that only the ones near the player
+    pay for their AI every turn.
+
+    Actors which are in view, near the player, woken up by noise or busy with something (see
+    `BaseAI.is_busy`) are active and act at their normal speed.  Those a bit further away are idle and
+    only act every IDLE_INTERVAL turns.  Everything else is dormant: it is taken out of the turn
+    scheduler and costs nothing until the player gets close or a noise wakes it up.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def __getstate__(self) -> dict:
+        return {}  # Rebuilt from the map on the first turn after loading.
+
+    def __setstate__(self, state: dict) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.game_map: Optional[GameMap] = None
+        self.actors_version = -1
+        self.known: Set[Actor] = set()
+        self.dormant: List[Actor] = []
+        self.dormant_xy = np.zeros((2, 0), dtype=np.intp)
+        self.woken_until: Dict[Actor, int] = {}
+
+    def get_actors_to_schedule(self, engine: Engine) -> List[Actor]:
+        """Return the actors which need to be put into the turn scheduler now.
+
+        These are the actors which are new on the map, or every actor if the map itself is new, and
+        the dormant actors which the player has come near enough to wake up.
+        """
+        game_map = engine.game_map
+        if game_map is not self.game_map:
+            self.reset()
+            self.game_map = game_map
+        new_actors = []
+        if game_map.actors_version != self.actors_version:
+            # Only actors coming or going, not items being picked up or dropped, need a rescan.
+            self.actors_version = game_map.actors_version
+            actors = {actor for actor in game_map.actors if actor is not engine.player}
+            new_actors = [actor for actor in actors if actor not in self.known]
+            self.known = actors
+        return new_actors + self._get_awake_dormant_actors(engine)
+
+    def get_tier(self, engine: Engine, actor: Actor) -> int:
+        px, py = engine.player.x, engine.player.y
+        distance = max(abs(actor.x - px), abs(actor.y - py))  # Chebyshev distance.
+        if (
+            distance <= ACTIVE_RADIUS
+            or engine.game_map.visible[actor.x, actor.y]
+            or self.woken_until.get(actor, -1) >= engine.turn_count
+            or (actor.ai is not None and actor.ai.is_busy)
+        ):
+            return ACTIVE
+        self.woken_until.pop(actor, None)
+        if distance <= IDLE_RADIUS:
+            return IDLE
+        return DORMANT
+
+    def make_dormant(self, actor: Actor) -> None:
+        self.dormant.append(actor)
+        self.dormant_xy = np.concatenate([self.dormant_xy, [[actor.x], [actor.y]]], axis=1)
+
+    def wake(self, engine: Engine, x: int, y: int, radius: int) -> List[Actor]:
+        """Make every actor within `radius` of x, y active for a while, as if it heard a noise.
+
+        Returns the dormant actors which were woken up, they need to be scheduled again.
+        """
+        until = engine.turn_count + WAKE_DURATION
+        game_map = engine.game_map
+        for cx in range(max(0, x - radius), min(game_map.width, x + radius + 1)):
+            for cy in range(max(0, y - radius), min(game_map.height, y + radius + 1)):
+                for actor in game_map.entities_at.get((cx, cy), ()):
+                    if actor in self.known:
+                        self.woken_until[actor] = until
+        if not self.dormant:
+            return []
+        heard = np.max(np.abs(self.dormant_xy - np.array([[x], [y]])), axis=0) <= radius
+        return self._pop_dormant(heard)
+
+    def _get_awake_dormant_actors(self, engine: Engine) -> List[Actor]:
+        """Remove and return the dormant actors which the player has come near enough to wake up."""
+        if not self.dormant:
+            return []
+        px, py = engine.player.x, engine.player.y
+        xs, ys = self.dormant_xy
+        near = np.maximum(np.abs(xs - px), np.abs(ys - py)) <= IDLE_RADIUS
+        near |= engine.game_map.visible[xs, ys]
+        return self._pop_dormant(near)
+
+    def _pop_dormant(self, mask: np.ndarray) -> List[Actor]:
+        if not mask.any():
+            return []
+        popped = [self.dormant[index] for index in np.flatnonzero(mask)]
+        keep = np.flatnonzero(~mask)
+        self.dormant = [self.dormant[index] for index in keep]
+        self.dormant_xy = self.dormant_xy[:, keep]
+        return popped
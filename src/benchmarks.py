@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+A reproducible benchmark suite for the game's hot paths: procgen, FOV and lighting, the AI turn
+loop, map rendering, zone save/load, stair transitions and pre-generated floors.
+
+Everything runs headless with fixed seeds and the results are written as JSON, so runs from
+different releases can be compared to catch regressions.
+
+    python3 benchmarks.py --output before.json
+    python3 benchmarks.py --quick --only ai fov
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np  # type: ignore
+import tcod
+from tcod.console import Console
+
+from components import ai
+from engine import Engine
+import entity_factories
+from game_map import GameMap
+from pregen import Pregenerator
+import setup_game
+import tile_types
+import zone_cache
+import zone_io
+
+
+SEED = 1234
+SCREEN_WIDTH = 80
+SCREEN_HEIGHT = 48
+
+
+class BenchmarkSuite:
+    """Runs the benchmarks and collects their timings, in seconds per call."""
+
+    def __init__(self, repeats: int = 10, seed: int = SEED):
+        self.repeats = repeats
+        self.seed = seed
+        self.results: List[Dict[str, Any]] = []
+
+    def new_engine(self, depth: int = 0) -> Engine:
+        """Return a new game, moved down to `depth` with a freshly generated floor."""
+        engine = setup_game.new_game(seed=self.seed)
+        if depth:
+            engine.world_location = [engine.world_location[0], depth]
+            engine.game_world.generate_floor()
+            engine.update_fov()
+        return engine
+
+    def measure(
+        self, name: str, params: Dict[str, Any], func: Callable[[], Any],
+        setup: Optional[Callable[[], Any]] = None, repeats: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Time `func` over several repeats, calling `setup` untimed before each of them."""
+        times = []
+        for _ in range(repeats or self.repeats):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        result = {
+            "name": name,
+            "params": params,
+            "repeats": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+            "max": max(times),
+        }
+        self.results.append(result)
+        print(f"{name:<12} {json.dumps(params):<36} median {result['median'] * 1000:9.3f} ms", file=sys.stderr)
+        return result
+
+    def bench_procgen(self, depths: Sequence[int]) -> None:
+        """Generate floors at several depths, the number of rooms grows with depth."""
+        import procgen  # Its spawn tables need the weapons to be initialized first.
+
+        engine = self.new_engine()
+        for depth in depths:
+            engine.world_location = [engine.world_location[0], depth]
+            self.measure(
+                "procgen", {"depth": depth},
+                lambda: procgen.generate_dungeon(map_width=80, map_height=41, engine=engine),
+            )
+
+    def bench_fov(self, light_counts: Sequence[int]) -> None:
+        """Update the FOV and light grid with many lit actors, from scratch and with moving lights."""
+        for lights in light_counts:
+            engine = self.new_engine(depth=5)
+            game_map = engine.game_map
+            actors = spawn_actors(game_map, lights, random.Random(self.seed))
+            for actor in actors:
+                actor.fighter.base_light = 5
+
+            def reset() -> None:
+                game_map._visibility = None  # Throw away every cached contribution.
+
+            self.measure("fov_cold", {"lights": lights}, engine.update_fov, setup=reset)
+
+            step = [1]
+
+            def move_lights() -> None:
+                step[0] = -step[0]
+                for actor in actors:
+                    if game_map.walkable[actor.x + step[0], actor.y]:
+                        actor.move(step[0], 0)
+
+            self.measure("fov_moving", {"lights": lights}, engine.update_fov, setup=move_lights)
+
+    def bench_ai(self, actor_counts: Sequence[int], turns: int = 10) -> None:
+        """Run enemy turns with crowds of HostileEnemy actors spread over an open arena."""
+        for count in actor_counts:
+            engine = self.new_engine()
+            # Big enough for the largest crowds while leaving room to move.
+            side = max(60, int(np.sqrt(count * 3)))
+            game_map = GameMap(engine, side, side, entities=(), default_fill=tile_types.concrete_floor)
+            game_map.tiles[[0, -1], :] = tile_types.concrete_wall
+            game_map.tiles[:, [0, -1]] = tile_types.concrete_wall
+            game_map.tiles_version += 1
+            engine.game_map = game_map
+            engine.player.place(side // 2, side // 2, game_map)
+            spawn_actors(game_map, count, random.Random(self.seed), avoid=(side // 2, side // 2))
+            engine.update_fov()
+
+            def play() -> None:
+                for _ in range(turns):
+                    engine.handle_ai_turns()
+                    engine.update_fov()
+                    engine.player.fighter.hp = engine.player.fighter.max_hp
+
+            for key in ai.path_cache_stats:
+                ai.path_cache_stats[key] = 0
+            result = self.measure("ai_turns", {"actors": count, "turns": turns}, play, repeats=max(1, self.repeats // 2))
+            result["path_cache"] = dict(ai.path_cache_stats)
+
+    def bench_render(self) -> None:
+        """Render the map, and the whole game screen, into an offscreen console."""
+        engine = self.new_engine(depth=5)
+        console = Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+        self.measure("render_map", {}, lambda: engine.game_map.render(console), setup=console.clear)
+        self.measure("render_all", {}, lambda: engine.render(console), setup=console.clear)
+
+    def bench_save_load(self, save_dir: str) -> None:
+        """Round trip the current zone through save_dungeon and load_dungeon, with each zone codec."""
+        engine = self.new_engine(depth=5)
+        engine.save_dir = save_dir
+        game_map = engine.game_map
+        for codec in zone_io.CODEC_NAMES:
+            engine.zone_codec = codec
+            # Saving only snapshots the zone, the writes are waited for in the untimed setup.
+            result = self.measure(
+                "zone_save", {"codec": codec}, engine.save_dungeon, setup=engine.zone_writer.flush
+            )
+            engine.zone_writer.flush()
+            result["bytes"] = os.path.getsize(engine.get_zone_filename())
+            self.measure("zone_load", {"codec": codec}, engine.load_dungeon)
+            engine.game_map = game_map
+
+    def bench_stairs(self, save_dir: str) -> None:
+        """Go down and back up a staircase, with the zone cache and with it disabled."""
+        engine = self.new_engine(depth=5)
+        engine.save_dir = save_dir
+        engine.descend()
+        engine.ascend()
+
+        def stair_dance() -> None:
+            engine.descend()
+            engine.ascend()
+
+        for budget in (zone_cache.DEFAULT_BUDGET, 0):
+            engine.zone_cache.budget = budget
+            self.measure("stairs", {"cache": bool(budget)}, stair_dance, setup=engine.zone_writer.flush)
+        engine.zone_writer.flush()
+
+    def bench_pregen(self, save_dir: str, depth: int = 10) -> None:
+        """Descend into a fresh zone, generated on the spot or generated ahead in a worker process."""
+        pregenerator = Pregenerator()
+        engines: List[Engine] = []
+
+        def setup(workers: int) -> None:
+            engine = self.new_engine(depth=depth)
+            engine.save_dir = save_dir
+            engine.pregenerator = pregenerator
+            pregenerator.workers = workers
+            engine.player.place(*engine.game_map.downstairs_location)
+            pregenerator.schedule(engine)
+            pregenerator.wait()
+            engines[:] = [engine]
+
+        for workers in (0, 1):
+            self.measure(
+                "descend_new", {"depth": depth, "pregenerated": bool(workers)},
+                lambda: engines[0].descend(), setup=lambda: setup(workers),
+            )
+        pregenerator.shutdown()
+
+
+def spawn_actors(
+    game_map: GameMap, count: int, rng: random.Random, avoid: Optional[tuple] = None
+) -> List[Any]:
+    """Spawn up to `count` omnibots on random free walkable tiles and return them."""
+    xs, ys = np.nonzero(game_map.walkable)
+    tiles = [
+        (int(x), int(y)) for x, y in zip(xs, ys)
+        if (x, y) != avoid and not game_map.get_entities_at_location(x, y)
+    ]
+    rng.shuffle(tiles)
+    return [entity_factories.omnibot.spawn(game_map, x, y) for x, y in tiles[:count]]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer repeats")
+    parser.add_argument(
+        "--only", nargs="+", choices=["procgen", "fov", "ai", "render", "save", "stairs", "pregen"], help="run only these benchmarks"
+    )
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(repeats=3 if args.quick else args.repeats, seed=args.seed)
+    only = set(args.only or ["procgen", "fov", "ai", "render", "save", "stairs", "pregen"])
+    entity_factories.initialize_all_weapons()
+
+    with contextlib.ExitStack() as stack:
+        # The game prints zone changes to stdout, keep it for the results.
+        stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        if "procgen" in only:
+            suite.bench_procgen([1, 5, 10] if args.quick else [1, 5, 10, 20, 40])
+        if "fov" in only:
+            suite.bench_fov([1, 10, 100])
+        if "ai" in only:
+            suite.bench_ai([10, 100, 1000] if args.quick else [10, 100, 1000, 5000])
+        if "render" in only:
+            suite.bench_render()
+        if "save" in only:
+            suite.bench_save_load(stack.enter_context(tempfile.TemporaryDirectory()))
+        if "stairs" in only:
+            suite.bench_stairs(stack.enter_context(tempfile.TemporaryDirectory()))
+        if "pregen" in only:
+            suite.bench_pregen(stack.enter_context(tempfile.TemporaryDirectory()))
+
+    report = {
+        "meta": {
+            "seed": args.seed,
+            "repeats": suite.repeats,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "tcod": tcod.__version__,
+            "platform": platform.platform(),
+        },
+        "results": suite.results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,80 @@
 from __future__ import annotations
 
+from collections import deque
 import random
-from typing import List, Optional, Tuple, TYPE_CHECKING
+from typing import Deque, List, Optional, Tuple, TYPE_CHECKING
 
 import numpy as np  # type: ignore
 import tcod
 
 from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
+import pathfinding
 
 if TYPE_CHECKING:
+    from engine import Engine
     from entity import Actor
 
 
+# A cached path is recomputed once its destination has moved further than this from the requested one.
+PATH_RETARGET_DISTANCE = 2
+
+# How often get_cached_path_to reused a cached path or had to compute a new one, for profiling.
+path_cache_stats = {"hits": 0, "misses": 0}
+
+
 class BaseAI(Action):
+    def __init__(self, entity: Actor, performedByPlayer: bool = False):
+        super().__init__(entity, performedByPlayer)
+        self.path: Deque[Tuple[int, int]] = deque()
+        self.path_target: Optional[Tuple[int, int]] = None
+
     def perform(self) -> None:
         raise NotImplementedError()
 
+    @property
+    def is_busy(self) -> bool:
+        """True if this AI is in the middle of something and should act every turn, even far from the player."""
+        return False
+
+    def get_cached_path_to(self, dest_x: int, dest_y: int) -> Deque[Tuple[int, int]]:
+        """Return `self.path` leading to the target position, only recomputing it when it's no longer valid."""
+        if self.path_is_valid(dest_x, dest_y):
+            path_cache_stats["hits"] += 1
+        else:
+            path_cache_stats["misses"] += 1
+            self.path = deque(self.get_path_to(dest_x, dest_y))
+            self.path_target = dest_x, dest_y
+        return self.path
+
+    def path_is_valid(self, dest_x: int, dest_y: int) -> bool:
+        """Return True if the cached path can still be followed to get to the target position.
+
+        The path is valid if it was computed for a target near this one and its next step is still
+        adjacent, walkable and unblocked.
+        """
+        if not self.path or self.path_target is None:
+            return False
+        if max(abs(self.path_target[0] - dest_x), abs(self.path_target[1] - dest_y)) > PATH_RETARGET_DISTANCE:
+            return False
+        next_x, next_y = self.path[0]
+        if max(abs(next_x - self.entity.x), abs(next_y - self.entity.y)) != 1:
+            return False
+        gamemap = self.entity.gamemap
+        return bool(gamemap.walkable[next_x, next_y]) and not gamemap.get_blocking_entity_at_location(
+            next_x, next_y
+        )
+
     def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
         """Compute and return a path to the target position.
 
         If there is no valid path then returns an empty list.
         """
-        # Copy the walkable array.
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
-
-        for entity in self.entity.gamemap.entities:
-            # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to the cost of a blocked position.
-                # A lower number means more enemies will crowd behind each other in
-                # hallways.  A higher number means enemies will take longer paths in
-                # order to surround the player.
-                cost[entity.x, entity.y] += 10
+        cost = pathfinding.get_cost_array(self.entity.gamemap)
 
         # Create a graph from the cost array and pass that graph to a new pathfinder.
-        graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
+        graph = tcod.path.SimpleGraph(
+            cost=cost, cardinal=pathfinding.CARDINAL_COST, diagonal=pathfinding.DIAGONAL_COST
+        )
         pathfinder = tcod.path.Pathfinder(graph)
 
         pathfinder.add_root((self.entity.x, self.entity.y))  # Start position.
@@ -45,11 +85,15 @@ class BaseAI(Action):
         # Convert from List[List[int]] to List[Tuple[int, int]].
         return [(index[0], index[1]) for index in path]
 
+    def clear_path(self) -> None:
+        """Forget the cached path, e.g. when moving some other way."""
+        self.path.clear()
+        self.path_target = None
+
 
 class StationaryEntity(BaseAI):
     def __init__(self, entity: Actor):
         super().__init__(entity, False)
-        self.path: List[Tuple[int, int]] = []
 
     def perform(self) -> None:
         return WaitAction(self.entity, False).perform()
@@ -58,7 +102,11 @@ class StationaryEntity(BaseAI):
 class HostileEnemy(BaseAI):
     def __init__(self, entity: Actor):
         super().__init__(entity, False)
-        self.path: List[Tuple[int, int]] = []
+        self.last_seen: Optional[Tuple[int, int]] = None  # Where the target was when it went out of sight.
+
+    @property
+    def is_busy(self) -> bool:
+        return bool(self.path or self.last_seen)
 
     def perform(self) -> None:
         target = self.engine.player
@@ -70,10 +118,28 @@ class HostileEnemy(BaseAI):
             if distance <= 1:
                 return MeleeAction(self.entity, False, dx, dy).perform()
 
-            self.path = self.get_path_to(target.x, target.y)
+            # Follow the distance map shared by everything chasing the target this turn.
+            self.last_seen = target.x, target.y
+            step = self.engine.game_map.get_flow_field_to(target.x, target.y).get_step(
+                self.entity.x, self.entity.y
+            )
+            if step:
+                self.clear_path()
+                return MovementAction(
+                    self.entity,
+                    False,
+                    step[0] - self.entity.x, step[1] - self.entity.y
+                ).perform()
+            self.get_cached_path_to(target.x, target.y)
+        elif self.last_seen:
+            if (self.entity.x, self.entity.y) == self.last_seen:
+                self.last_seen = None  # Got there, and the target is nowhere to be seen.
+            else:
+                # Lost sight of the target, head to where it was last seen.
+                self.get_cached_path_to(*self.last_seen)
 
         if self.path:
-            dest_x, dest_y = self.path.pop(0)
+            dest_x, dest_y = self.path.popleft()
             return MovementAction(
                 self.entity,
                 False,
@@ -83,44 +149,91 @@ class HostileEnemy(BaseAI):
         return WaitAction(self.entity, False).perform()
 
 
+def perform_chase_batch(engine: Engine, actors: List[Actor]) -> List[Actor]:
+    """
+    Take the turn of every HostileEnemy in `actors` which is just stepping towards the player, all at once.
+
+    Their next steps are read from the shared flow field and collisions between them are resolved in a
+    few vectorized passes instead of one MovementAction each.  Returns the actors which have to act on
+    their own instead, such as the ones close enough to attack.
+    """
+    game_map = engine.game_map
+    target = engine.player
+    chasers = [actor for actor in actors if type(actor.ai) is HostileEnemy]
+    if len(chasers) < 2:
+        return actors
+    xs = np.array([actor.x for actor in chasers])
+    ys = np.array([actor.y for actor in chasers])
+    distance = np.maximum(np.abs(xs - target.x), np.abs(ys - target.y))  # Chebyshev distance.
+    chasing = game_map.visible[xs, ys] & (distance > 1)
+    if not chasing.any():
+        return actors
+
+    step_x, step_y, has_step = game_map.get_flow_field_to(target.x, target.y).get_steps(xs, ys)
+    batched = chasing & has_step
+
+    # Tiles taken by anything blocking, updated as the batch moves.
+    blocked = np.zeros((game_map.width, game_map.height), dtype=bool)
+    for (x, y), entities in game_map.entities_at.items():
+        if any(entity.blocks_movement for entity in entities):
+            blocked[x, y] = True
+
+    pending = np.flatnonzero(batched)
+    moved = np.zeros(len(chasers), dtype=bool)
+    while pending.size:
+        candidates = pending[~blocked[step_x[pending], step_y[pending]]]
+        if not candidates.size:
+            break  # The rest are blocked, their moves fail just like a blocked MovementAction.
+        # When several actors want the same tile the first one gets it.
+        _, first = np.unique(step_x[candidates] * game_map.height + step_y[candidates], return_index=True)
+        winners = candidates[first]
+        blocked[xs[winners], ys[winners]] = False
+        blocked[step_x[winners], step_y[winners]] = True
+        moved[winners] = True
+        pending = np.setdiff1d(pending, winners, assume_unique=True)
+
+    for index in np.flatnonzero(batched):
+        actor = chasers[index]
+        actor.ai.last_seen = target.x, target.y
+        actor.ai.clear_path()
+        if moved[index]:
+            actor.move_to(int(step_x[index]), int(step_y[index]))
+
+    batched_actors = {chasers[index] for index in np.flatnonzero(batched)}
+    return [actor for actor in actors if actor not in batched_actors]
+
+
 class ConfusedEnemy(BaseAI):
     """
-    A confused enemy will stumble around aimlessly for a given number of turns, then revert back to its previous AI.
+    A confused enemy will stumble around aimlessly until the Confused status effect on it wears off,
+    which reverts it back to its previous AI.
     If an actor occupies a tile it is randomly moving into, it will attack.
     """
 
-    def __init__(
-        self, entity: Actor, previous_ai: Optional[BaseAI], turns_remaining: int
-    ):
+    def __init__(self, entity: Actor, previous_ai: Optional[BaseAI]):
         super().__init__(entity, False)
 
         self.previous_ai = previous_ai
-        self.turns_remaining = turns_remaining
 
-    def perform(self) -> None:
-        # Revert the AI back to the original state if the effect has run its course.
-        if self.turns_remaining <= 0:
-            self.engine.message_log.add_message(
-                f"The {self.entity.name} is no longer confused."
-            )
-            self.entity.ai = self.previous_ai
-        else:
-            # Pick a random direction
-            direction_x, direction_y = random.choice(
-                [
-                    (-1, -1),  # Northwest
-                    (0, -1),  # North
-                    (1, -1),  # Northeast
-                    (-1, 0),  # West
-                    (1, 0),  # East
-                    (-1, 1),  # Southwest
-                    (0, 1),  # South
-                    (1, 1),  # Southeast
-                ]
-            )
-
-            self.turns_remaining -= 1
+    @property
+    def is_busy(self) -> bool:
+        return True  # Keeps stumbling around even when nobody is watching.
 
-            # The actor will either try to move or attack in the chosen random direction.
-            # Its possible the actor will just bump into the wall, wasting a turn.
-            return BumpAction(self.entity, False, direction_x, direction_y,).perform()
+    def perform(self) -> None:
+        # Pick a random direction
+        direction_x, direction_y = random.choice(
+            [
+                (-1, -1),  # Northwest
+                (0, -1),  # North
+                (1, -1),  # Northeast
+                (-1, 0),  # West
+                (1, 0),  # East
+                (-1, 1),  # Southwest
+                (0, 1),  # South
+                (1, 1),  # Southeast
+            ]
+        )
+
+        # The actor will either try to move or attack in the chosen random direction.
+        # Its possible the actor will just bump into the wall, wasting a turn.
+        return BumpAction(self.entity, False, direction_x, direction_y,).perform()
@@ -4,8 +4,8 @@ from typing import Optional, TYPE_CHECKING
 
 import actions
 import color
-import components.ai
 import components.inventory
+from components.status_effects import Confused
 from components.base_component import BaseComponent
 from exceptions import Impossible
 from input_handlers import (
@@ -68,9 +68,7 @@ class ConfusionConsumable(Consumable):
             f"The eyes of the {target.name} look vacant, as it starts to stumble around!",
             color.status_effect_applied,
         )
-        target.ai = components.ai.ConfusedEnemy(
-            entity=target, previous_ai=target.ai, turns_remaining=self.number_of_turns,
-        )
+        target.fighter.apply_status_effect(Confused(self.number_of_turns))
         self.consume()
 
 
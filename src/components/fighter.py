@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import Dict, TYPE_CHECKING
 
 from const import *
 import color
@@ -8,6 +8,7 @@ from components.base_component import BaseComponent
 from render_order import RenderOrder
 
 if TYPE_CHECKING:
+    from components.status_effects import StatusEffect
     from entity import Actor
 
 
@@ -18,7 +19,7 @@ class Fighter(BaseComponent):
                  zeal = 1, guts = 1, tech = 1, luck = 1,
                  hp = 1, av = 0, dmg = 1, atk = 100, dr = 0,
                  beauty = 0, scary = 0, light = 0, vision = 20,
-                 acc = 100, missile_damage = 0, courage = 0
+                 acc = 100, missile_damage = 0, courage = 0, speed = 100
                  ):
         self._zeal              = zeal
         self._guts              = guts
@@ -37,6 +38,9 @@ class Fighter(BaseComponent):
         self.base_accuracy      = acc
         self.base_missile_damage= missile_damage
         self.base_courage       = courage
+        self.base_speed         = speed     # 100 is normal, higher acts more often
+        self.status_effects: Dict[str, StatusEffect] = {}
+        self.effect_bonuses: Dict[str, int] = {}    # stat name : bonus from the current status effects
 
     @property
     def zeal(self) -> int:
@@ -65,41 +69,45 @@ class Fighter(BaseComponent):
             
     @property
     def beauty(self) -> int:
-        return self.base_beauty + self.beauty_bonus
+        return self.base_beauty + self.beauty_bonus + self.effect_bonuses.get("beauty", 0)
     @property
     def scary(self) -> int:
-        return self.base_scary + self.scary_bonus
+        return self.base_scary + self.scary_bonus + self.effect_bonuses.get("scary", 0)
     @property
     def courage(self) -> int:
         return self.base_courage + self.guts
 
     @property
     def defense(self) -> int:
-        return self.base_defense + self.defense_bonus
+        return self.base_defense + self.defense_bonus + self.effect_bonuses.get("defense", 0)
     @property
     def dodge(self) -> int:
-        return self.base_dodge + self.dodge_bonus
+        return self.base_dodge + self.dodge_bonus + self.effect_bonuses.get("dodge", 0)
 
     @property
     def power(self) -> int:
-        return self.base_power + self.power_bonus
+        return self.base_power + self.power_bonus + self.effect_bonuses.get("power", 0)
     @property
     def attack(self) -> int:
-        return self.base_attack + self.attack_bonus
+        return self.base_attack + self.attack_bonus + self.effect_bonuses.get("attack", 0)
     
     @property
     def accuracy(self) -> int:
-        return self.base_accuracy + self.accuracy_bonus
+        return self.base_accuracy + self.accuracy_bonus + self.effect_bonuses.get("accuracy", 0)
     @property
     def missile_damage(self) -> int:
-        return self.base_missile_damage + self.missile_damage_bonus
+        return self.base_missile_damage + self.missile_damage_bonus + self.effect_bonuses.get("missile_damage", 0)
     
     @property
     def light(self) -> int:
-        return self.base_light + self.light_bonus
+        return self.base_light + self.light_bonus + self.effect_bonuses.get("light", 0)
     @property
     def vision(self) -> int:
-        return self.base_vision + self.vision_bonus
+        return self.base_vision + self.vision_bonus + self.effect_bonuses.get("vision", 0)
+
+    @property
+    def speed(self) -> int:
+        return self.base_speed + self.effect_bonuses.get("speed", 0)
 
     @property
     def beauty_bonus(self) -> int:
@@ -181,6 +189,7 @@ class Fighter(BaseComponent):
         self.parent.ai = None
         self.parent.name = f"remains of {self.parent.name}"
         self.parent.render_order = RenderOrder.CORPSE
+        self.parent.gamemap.invalidate_render_list()
 
         self.engine.message_log.add_message(death_message, death_message_color)
 
@@ -203,3 +212,7 @@ class Fighter(BaseComponent):
 
     def take_damage(self, amount: int) -> None:
         self.hp -= amount
+
+    def apply_status_effect(self, effect: StatusEffect) -> None:
+        """Apply a timed status effect to this actor.  See components.status_effects."""
+        self.engine.status_effects.apply(self.engine, self.parent, effect)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import color
+from components.ai import ConfusedEnemy
+from turn_scheduler import TURN_LENGTH
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Actor
+    from game_map import GameMap
+
+
+class StatusEffect:
+    """
+    A timed effect on an actor, such as confusion, a buff or damage over time.
+
+    `duration` and `tick_interval` are in turns.  `bonuses` maps Fighter stat names (e.g. "power",
+    "defense", "speed") to the amount added to them while the effect lasts.
+    """
+
+    name = "<status>"
+    tick_interval = 0  # Turns between calls to on_tick, 0 if the effect doesn't tick.
+
+    def __init__(self, duration: int, bonuses: Optional[Dict[str, int]] = None):
+        self.duration = duration
+        self.bonuses = bonuses or {}
+        self.target: Optional[Actor] = None
+        self.expires_at = 0
+        self.next_tick_at: Optional[int] = None
+
+    @property
+    def next_event_at(self) -> int:
+        if self.next_tick_at is not None and self.next_tick_at <= self.expires_at:
+            return self.next_tick_at
+        return self.expires_at
+
+    def on_apply(self, engine: Engine) -> None:
+        pass
+
+    def on_tick(self, engine: Engine) -> None:
+        pass
+
+    def on_expire(self, engine: Engine) -> None:
+        pass
+
+    def get_expire_message(self) -> Optional[str]:
+        """The message shown when the effect wears off in view, if any."""
+        return None
+
+
+class Confused(StatusEffect):
+    """The actor stumbles around aimlessly until the effect wears off."""
+
+    name = "confused"
+
+    def on_apply(self, engine: Engine) -> None:
+        self.target.ai = ConfusedEnemy(entity=self.target, previous_ai=self.target.ai)
+
+    def on_expire(self, engine: Engine) -> None:
+        if isinstance(self.target.ai, ConfusedEnemy):
+            self.target.ai = self.target.ai.previous_ai
+
+    def get_expire_message(self) -> Optional[str]:
+        return f"The {self.target.name} is no longer confused."
+
+
+class StatBuff(StatusEffect):
+    """Raises (or with negative bonuses, lowers) some of the actor's stats for a while."""
+
+    def __init__(self, name: str, duration: int, bonuses: Dict[str, int]):
+        super().__init__(duration, bonuses)
+        self.name = name
+
+
+class DamageOverTime(StatusEffect):
+    """Deals `damage` to the actor every `tick_interval` turns, e.g. bleeding or burning."""
+
+    def __init__(self, name: str, duration: int, damage: int, tick_interval: int = 1):
+        super().__init__(duration)
+        self.name = name
+        self.damage = damage
+        self.tick_interval = tick_interval
+
+    def on_tick(self, engine: Engine) -> None:
+        if engine.game_map.visible[self.target.x, self.target.y]:
+            engine.message_log.add_message(
+                f"{self.target.title.capitalize()}{self.target.name} takes {self.damage} damage from {self.name}.",
+                color.status_effect_applied,
+            )
+        self.target.fighter.take_damage(self.damage)
+
+
+class StatusEffectQueue:
+    """
+    Every active status effect, in a min-heap keyed on the time of its next tick or expiry.
+
+    Applying or removing an effect is O(log n), and advancing time only touches the effects which
+    tick or expire in that time.  Superseded heap entries are skipped when popped.
+    """
+
+    def __init__(self) -> None:
+        self.queue: List[Tuple[int, int, StatusEffect]] = []
+        self.entries: Dict[StatusEffect, int] = {}  # effect: sequence number of its live entry
+        self._sequence = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def next_time(self) -> Optional[int]:
+        """The time of the next tick or expiry, or None if no effect is active."""
+        queue = self.queue
+        while queue and self.entries.get(queue[0][2]) != queue[0][1]:
+            heapq.heappop(queue)  # Superseded.
+        return queue[0][0] if queue else None
+
+    def apply(self, engine: Engine, target: Actor, effect: StatusEffect) -> None:
+        """Apply an effect to `target`.  Applying an effect it already has refreshes its duration instead."""
+        now = engine.scheduler.time
+        fighter = target.fighter
+        existing = fighter.status_effects.get(effect.name)
+        if existing is not None:
+            existing.expires_at = max(existing.expires_at, now + effect.duration * TURN_LENGTH)
+            self._push(existing)
+            return
+
+        effect.target = target
+        effect.expires_at = now + effect.duration * TURN_LENGTH
+        if effect.tick_interval:
+            effect.next_tick_at = now + effect.tick_interval * TURN_LENGTH
+        fighter.status_effects[effect.name] = effect
+        for stat, amount in effect.bonuses.items():
+            fighter.effect_bonuses[stat] = fighter.effect_bonuses.get(stat, 0) + amount
+        effect.on_apply(engine)
+        self._push(effect)
+
+    def remove(self, engine: Engine, effect: StatusEffect) -> None:
+        """End an effect now."""
+        if self.entries.pop(effect, None) is not None:
+            self._end(engine, effect)
+
+    def settle(self, engine: Engine, game_map: GameMap) -> None:
+        """End the effects on the actors of `game_map` quietly, as when the player leaves it.
+
+        The player's own effects go on.  The queue then refers to no actor of a zone being cached or saved.
+        """
+        settled = [
+            effect for effect in self.entries
+            if effect.target.parent is game_map and effect.target is not engine.player
+        ]
+        for effect in settled:
+            del self.entries[effect]
+            self._end(engine, effect, announce=False)
+        self.queue = [entry for entry in self.queue if self.entries.get(entry[2]) == entry[1]]
+        heapq.heapify(self.queue)
+
+    def _end(self, engine: Engine, effect: StatusEffect, announce: bool = True) -> None:
+        target = effect.target
+        fighter = target.fighter
+        del fighter.status_effects[effect.name]
+        for stat, amount in effect.bonuses.items():
+            fighter.effect_bonuses[stat] -= amount
+        effect.on_expire(engine)
+        if announce and target.is_alive and target.parent is engine.game_map:
+            message = effect.get_expire_message()
+            if message:
+                engine.message_log.add_message(message)
+
+    def process_due(self, engine: Engine, until: int) -> None:
+        """Run every tick and expiry scheduled at or before `until`."""
+        queue = self.queue
+        while queue and queue[0][0] <= until:
+            time, sequence, effect = heapq.heappop(queue)
+            if self.entries.get(effect) != sequence:
+                continue  # Superseded by a later entry.
+            del self.entries[effect]
+            target = effect.target
+            if not target.is_alive or target.parent is not engine.game_map:
+                # Nobody is left to feel it, or it wore off while the actor was off the current map.
+                self._end(engine, effect, announce=False)
+            elif effect.next_tick_at is not None and effect.next_tick_at <= min(time, effect.expires_at):
+                effect.next_tick_at += effect.tick_interval * TURN_LENGTH
+                self._push(effect)
+                effect.on_tick(engine)
+            else:
+                self._end(engine, effect)
+
+    def _push(self, effect: StatusEffect) -> None:
+        self._sequence += 1
+        self.entries[effect] = self._sequence
+        heapq.heappush(self.queue, (effect.next_event_at, self._sequence, effect))
@@ -246,3 +246,5 @@ SLOTS_SHORTHAND = {
 "offhand" : "O",
 "armor" : "W",
     }
+
+NOISE_MELEE = 8     # how far away the sound of a fight wakes things up
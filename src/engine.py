@@ -1,72 +1,158 @@
 from __future__ import annotations
 
-import numpy as np
 import color
 import random
 import time
 import lzma
+import os
 import pickle
-from typing import TYPE_CHECKING
+from typing import Optional, Tuple, TYPE_CHECKING
 
 from tcod.console import Console
-from tcod.map import compute_fov
 
+import activity
+from activity import ActivityScheduler
+from components.ai import perform_chase_batch
+from components.status_effects import StatusEffectQueue
 import exceptions
-from message_log import MessageLog
+from message_log import MessageArchive, MessageLog
+from pregen import Pregenerator
+import profiling
 import render_functions
 import tile_types
+from turn_scheduler import get_action_delay, TurnScheduler
+from zone_cache import ZoneCache
+import zone_io
 
 if TYPE_CHECKING:
     from entity import Actor
     from game_map import GameMap, GameWorld
+    import weakref
 
 
 class Engine:
     game_map: GameMap
     game_world: GameWorld
+    zone_codec = zone_io.DEFAULT_CODEC  # How zones are compressed when saved, see zone_io.CODECS.
 
-    def __init__(self, player: Actor):
+    def __init__(self, player: Actor, seed: Optional[int] = None, save_dir: str = "../sav"):
         self.coming_from = -1 # -1 is from above, 1 from below
         self.message_log = MessageLog()
+        self.save_dir = save_dir
         self.mouse_location = (0, 0)
+        self.tooltip_cache: Tuple[Optional[weakref.ref], Optional[tuple], str] = (None, None, "")  # see render_functions.get_mouse_tooltip
         self.player = player
-        random.seed(time.time())
+        random.seed(time.time() if seed is None else seed)
         self.world_seed = int(random.random()*1000000)
         self.world_location = [40,0] # x, y
         self.explored_zones = {} # world location (x,y,) : map starting seed location (x,y,)
+        self.turn_count = 0
+        self.activity = ActivityScheduler()
+        self.scheduler = TurnScheduler()
+        self.status_effects = StatusEffectQueue()
+        self.zone_writer = zone_io.ZoneWriter()
+        self.zone_cache = ZoneCache()
+        self.pregenerator = Pregenerator()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["zone_writer"]  # Its thread can't be saved, and save_as flushed it.
+        del state["zone_cache"]  # save_as saved the cached zones to their own files.
+        del state["pregenerator"]  # Loaded games start with none, see setup_game.start_game.
+        del state["tooltip_cache"]  # Holds a weak reference to a map, which can't be saved.
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.zone_writer = zone_io.ZoneWriter()
+        self.zone_cache = ZoneCache()
+        self.pregenerator = Pregenerator()
+        self.tooltip_cache = (None, None, "")
+
+    @property
+    def save_dir(self) -> str:
+        """Where the zones and the message archive of this game are saved."""
+        return self._save_dir
+
+    @save_dir.setter
+    def save_dir(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self._save_dir = path
+        self.message_log.archive = MessageArchive(path)
+
+    def get_zone_filename(self, location: Optional[Tuple[int, int]] = None) -> str:
+        x, y = location or self.world_location
+        return os.path.join(self.save_dir, "wd_{},{}.sav".format(x, y))
 
     def save_dungeon(self):
-        """Save this Engine instance as a compressed file."""
-        filename = "../sav/wd_{},{}.sav".format(self.world_location[0], self.world_location[1])
-        print("saving zone: ({}, {})".format(self.world_location[0], self.world_location[1]))
-        self.game_map.engine = None
-        _entities = self.game_map.entities
-        self.game_map.entities = set()
-        save_data = lzma.compress(pickle.dumps(self.game_map))
-        with open(filename, "wb") as f:
-            f.write(save_data)
-        self.game_map.engine = self
-        self.game_map.entities = _entities
+        """Save the current zone."""
+        self.save_zone(tuple(self.world_location), self.game_map)
+    def save_zone(self, location: Tuple[int, int], game_map: GameMap) -> None:
+        """Save a zone.  The map is snapshotted now, and written out in the background.
+
+        Status effects on its actors end first, none would be tracked once it's loaded again.
+        """
+        print("saving zone: ({}, {})".format(*location))
+        self.status_effects.settle(self, game_map)
+        self.zone_writer.save(self.get_zone_filename(location), zone_io.snapshot_zone(game_map), self.zone_codec)
     def load_dungeon(self):
-        filename = "../sav/wd_{},{}.sav".format(self.world_location[0], self.world_location[1])
+        filename = self.get_zone_filename()
         print("loading zone: ({}, {})".format(self.world_location[0], self.world_location[1]))
-        with open(filename, "rb") as f:
-            self.game_map = pickle.loads(lzma.decompress(f.read()))
-        self.game_map.engine = self
-        self.game_map.entities = set([self.player])
-        # load in new set of entities based on what the player has done on this floor
+        self.zone_writer.flush(filename)  # It may still be on its way to the disk.
+        self.game_map = zone_io.read_zone(filename, regenerate=self.game_world.regenerate_floor, engine=self)
+        self.player.place(self.player.x, self.player.y, self.game_map)
 
-    def descend(self, new_stairs=True, reposition=None):
-        self.coming_from = -1
-        # save
-        self.save_dungeon()
-        # change floors
-        self.world_location = [self.world_location[0], self.world_location[1] + 1]
-        # load or generate new
-        if (self.world_location[0],self.world_location[1]) in self.explored_zones:
+    def leave_zone(self) -> None:
+        """Keep the current map in the zone cache, saving whichever zones it evicts.
+
+        Status effects on its actors end here, the effect queue only follows the current map.
+        """
+        self.status_effects.settle(self, self.game_map)
+        for location, game_map in self.zone_cache.put(tuple(self.world_location), self.game_map):
+            self.save_zone(location, game_map)
+    def enter_zone(self) -> None:
+        """Make the zone at the world location current: from the zone cache, its save, or generated."""
+        location = (self.world_location[0], self.world_location[1])
+        game_map = self.zone_cache.pop(location)
+        if game_map is not None:
+            print("reusing zone: ({}, {})".format(*location))
+            self.game_map = game_map
+            self.player.place(self.player.x, self.player.y, self.game_map)
+        elif location in self.explored_zones:
             self.load_dungeon()
         else:
-            self.game_world.generate_floor()
+            game_map = self.pregenerator.adopt(self)
+            if game_map is not None:
+                print("using zone generated ahead: ({}, {})".format(*location))
+                self.game_map = game_map
+            else:
+                self.game_world.generate_floor()
+        self.pregenerator.schedule(self)
+
+    def change_zone(self, dy: int) -> None:
+        """Leave the current zone for the one `dy` floors down, keeping or saving it, and enter that one.
+
+        A failed save of the zone entered is raised by the flush before it's loaded.  A pending one is
+        waited for before leaving, and if entering still fails the player stays in the current zone.
+        """
+        location = (self.world_location[0], self.world_location[1])
+        target = (location[0], location[1] + dy)
+        coming_from = self.coming_from
+        self.zone_writer.flush(self.get_zone_filename(target))
+        self.coming_from = -1 if dy > 0 else 1
+        self.leave_zone()
+        self.world_location = list(target)
+        try:
+            self.enter_zone()
+        except Exception:
+            self.world_location = list(location)
+            self.coming_from = coming_from
+            self.zone_cache.pop(location)  # Unless leaving already evicted and saved it.
+            raise
+
+    def descend(self, new_stairs=True, reposition=None):
+        # keep or save, change floors, then reuse, load or generate new
+        self.change_zone(1)
 
         print("location: ", self.world_location)
         
@@ -77,87 +163,141 @@ class Engine:
             "You descend the staircase.", color.descend
         )
 
-        if (new_stairs and self.coming_from == -1 and (self.game_map.tiles[self.player.x, self.player.y]['stairs_up'] == False)):
+        if (new_stairs and self.coming_from == -1 and not self.game_map.get_tile_is_staircase_up_at_location(self.player.x, self.player.y)):
             self.message_log.add_message(
                 "You've unlocked a new ascending staircase on this level.", color.descend
             )
-            self.game_map.tiles[self.player.x, self.player.y] = tile_types.up_stairs
+            self.game_map.set_tile(self.player.x, self.player.y, tile_types.up_stairs)
             
     def ascend(self, new_stairs=True):
-        self.coming_from = 1
-        # save
-        self.save_dungeon()
-        # change floors
-        self.world_location = [self.world_location[0], self.world_location[1] - 1]
-        # load or generate new
-        if (self.world_location[0],self.world_location[1]) in self.explored_zones:
-            self.load_dungeon()
-        else:
-            self.game_world.generate_floor()
+        # keep or save, change floors, then reuse, load or generate new
+        self.change_zone(-1)
         print("location: ", self.world_location)
         self.message_log.add_message(
             "You ascend the staircase.", color.ascend
         )
 
-        if (new_stairs and self.coming_from == -1 and (self.game_map.tiles[self.player.x, self.player.y]['stairs_down'] == False)):
+        if (new_stairs and self.coming_from == -1 and not self.game_map.get_tile_is_staircase_down_at_location(self.player.x, self.player.y)):
             self.message_log.add_message(
                 "You've unlocked a new descending staircase on this level.", color.descend
             )
-            self.game_map.tiles[self.player.x, self.player.y] = tile_types.down_stairs
+            self.game_map.set_tile(self.player.x, self.player.y, tile_types.down_stairs)
 
 
     def handle_ai_turns(self) -> None:
-        for entity in set(self.game_map.actors) - {self.player}:
-            if entity.ai:
+        """Let the other actors act until it's the player's turn again."""
+        self.turn_count += 1
+        self.advance_time(get_action_delay(self.player))
+
+    def advance_time(self, duration: int) -> None:
+        """Let `duration` units of time pass, running the actions of every actor whose time comes up.
+
+        If nothing is scheduled in that time it simply passes, which makes long waits cheap.
+        """
+        scheduler = self.scheduler
+        self.schedule_new_actors()
+
+        until = scheduler.time + duration
+        for time, actors in scheduler.pop_due_batches(until):
+            self.status_effects.process_due(self, time)
+            # Drop actors which died or left the map from the schedule.
+            actors = [actor for actor in actors if actor.ai and actor.parent is self.game_map]
+            # Monsters simply chasing the player move together, the rest act one by one.
+            for actor in perform_chase_batch(self, actors):
                 try:
-                    entity.ai.perform()
+                    actor.ai.perform()
                 except exceptions.Impossible:
                     pass  # Ignore impossible action exceptions from AI.
 
+            for actor in actors:
+                if not actor.ai:
+                    continue
+                tier = self.activity.get_tier(self, actor)
+                if tier == activity.DORMANT:
+                    self.activity.make_dormant(actor)
+                else:
+                    delay = get_action_delay(actor)
+                    if tier == activity.IDLE:
+                        delay *= activity.IDLE_INTERVAL
+                    scheduler.schedule(actor, time + delay)
+        self.status_effects.process_due(self, until - 1)
+        scheduler.time = until
+
+    def schedule_new_actors(self) -> None:
+        """Put the actors which are new on the map, or which the player came near, into the turn scheduler."""
+        scheduler = self.scheduler
+        if self.activity.game_map is not self.game_map:
+            scheduler.clear()
+        for actor in self.activity.get_actors_to_schedule(self):
+            scheduler.schedule(actor, scheduler.time)
+
+    def fast_forward(self, turns: int) -> int:
+        """Let up to `turns` of the player's turns pass while the player waits, as when resting.
+
+        Turns in which no actor acts and no status effect ticks or expires are skipped in one jump,
+        straight to the next thing due.  Stops early once the player is hurt or something comes into
+        view.  Returns the number of turns that passed.
+        """
+        scheduler = self.scheduler
+        player = self.player
+        hp = player.fighter.hp
+        passed = 0
+        while passed < turns:
+            self.schedule_new_actors()
+            delay = get_action_delay(player)
+            due = [time for time in (scheduler.next_time, self.status_effects.next_time) if time is not None]
+            idle = turns - passed
+            if due:
+                idle = min(idle, (min(due) - scheduler.time) // delay)
+            if idle > 0:
+                # Nothing happens until then, not even for the FOV to notice.
+                scheduler.time += idle * delay
+                self.turn_count += idle
+                passed += idle
+                continue
+
+            self.handle_ai_turns()
+            self.update_fov()
+            passed += 1
+            if not player.is_alive or player.fighter.hp < hp or self.is_actor_in_view():
+                break
+        return passed
+
+    def is_actor_in_view(self) -> bool:
+        """Return True if the player can see another living actor."""
+        visible = self.game_map.visible
+        return any(actor is not self.player and visible[actor.x, actor.y] for actor in self.game_map.actors)
+
+    def make_noise(self, x: int, y: int, radius: int) -> None:
+        """Wake up the actors within earshot of a noise made at x, y."""
+        for actor in self.activity.wake(self, x, y, radius):
+            self.scheduler.schedule(actor, self.scheduler.time)
+
     def update_fov(self) -> None:
-        """Recompute the visible area based on the players point of view."""
-        
-        def _circ(vismap, lgt, actor): # make FOV area into a circle shape
-            x, y = np.indices(vismap.shape)
-            distance = np.sqrt((x - actor.x)**2 + (y - actor.y)**2)
-            return (vismap & (distance <= lgt))
+        """Recompute the visible area based on the players point of view.
+
+        Only the parts of the view and the light grid whose inputs changed since the last call are
+        recomputed, so turns where nothing moves cost almost nothing here.
+        """
+        game_map = self.game_map
+        player = self.player
 
         # compute player's FOV
         # vision level is affected by the player's light radius
         lgt_bonus = 10 if self.world_location[1] == 0 else 0
-        rad = int(min(max(self.player.fighter.vision*0.1, (self.player.fighter.light + lgt_bonus)*2), self.player.fighter.vision))
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles["transparent"],
-            (self.player.x, self.player.y),
-            radius=rad,
-        )
-        self.game_map.visible = _circ(self.game_map.visible, rad, self.player)
-        # compute player's FOV for things that are obscured
-        self.game_map.obscured_but_visible[:] = compute_fov(
-            self.game_map.tiles["not_obscuring"],
-            (self.player.x, self.player.y),
-            radius=self.player.fighter.vision,
-        )
-        self.game_map.obscured_but_visible = _circ(self.game_map.obscured_but_visible, rad, self.player)
-        self.game_map.obscured_but_visible = np.logical_and(self.game_map.obscured_but_visible, np.logical_not(self.game_map.visible))
+        rad = int(min(max(player.fighter.vision*0.1, (player.fighter.light + lgt_bonus)*2), player.fighter.vision))
+        changed = game_map.visibility.update_player_fov(player.x, player.y, rad)
 
         # calculate the light grid
-        self.game_map.remove_all_light()
-        for actor in self.game_map.actors:
-            if actor.fighter.light <= 0:
-                continue
-            if not self.game_map.in_bounds(actor.x, actor.y):
-                continue
-            lighthere = compute_fov(
-                self.game_map.tiles["transparent"],
-                (actor.x, actor.y),
-                radius=actor.fighter.light + lgt_bonus,
-            )
-            lighthere = _circ(lighthere, actor.fighter.light + lgt_bonus, actor)
-            self.game_map.lit_tiles[:] |= lighthere
-        # Update the set of tiles that the player can see clearly, and the set of "explored" tiles
-        self.game_map.get_lit_and_visible()
-        self.game_map.add_explored()
+        changed |= game_map.visibility.update_lights(
+            (actor, actor.x, actor.y, actor.fighter.light + lgt_bonus)
+            for actor in game_map.actors
+            if actor.fighter.light > 0 and game_map.in_bounds(actor.x, actor.y)
+        )
+        if changed:
+            # Update the set of tiles that the player can see clearly, and the set of "explored" tiles
+            game_map.get_lit_and_visible()
+            game_map.add_explored()
 
     def render(self, console: Console) -> None:
         self.game_map.render(console)
@@ -181,8 +321,16 @@ class Engine:
             console=console, x=21, y=41, engine=self
         )
 
+        if profiling.timer.show_overlay:
+            render_functions.render_phase_timings(
+                console=console, timer=profiling.timer, location=(console.width - 29, 0)
+            )
+
     def save_as(self, filename: str) -> None:
         """Save this Engine instance as a compressed file."""
+        for location, game_map in self.zone_cache.items():
+            self.save_zone(location, game_map)
+        self.zone_writer.flush()  # The game save must not get ahead of the zones it refers to.
         save_data = lzma.compress(pickle.dumps(self))
         with open(filename, "wb") as f:
             f.write(save_data)
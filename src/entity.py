@@ -56,7 +56,7 @@ class Entity:
         if parent:
             # If parent isn't provided now then it will be set later.
             self.parent = parent
-            parent.entities.add(self)
+            parent.add_entity(self)
 
     @property
     def gamemap(self) -> GameMap:
@@ -84,19 +84,21 @@ class Entity:
         clone.x = x
         clone.y = y
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         return clone
 
     def place(self, x: int, y: int, gamemap: Optional[GameMap] = None) -> None:
         """Place this entitiy at a new location.  Handles moving across GameMaps."""
-        self.x = x
-        self.y = y
         if gamemap:
             if hasattr(self, "parent"):  # Possibly uninitialized.
                 if self.parent is self.gamemap:
-                    self.gamemap.entities.remove(self)
+                    self.gamemap.remove_entity(self)
+            self.x = x
+            self.y = y
             self.parent = gamemap
-            gamemap.entities.add(self)
+            gamemap.add_entity(self)
+        else:
+            self.move_to(x, y)
 
     def distance(self, x: int, y: int) -> float:
         """
@@ -108,10 +110,17 @@ class Entity:
         # Move the entity by a given amount
         self.x += dx
         self.y += dy
+        self._update_location()
     def move_to(self, dest_x: int, dest_y: int) -> None:
         # Move the entity by a given amount
         self.x = dest_x
         self.y = dest_y
+        self._update_location()
+
+    def _update_location(self) -> None:
+        """Keep the map's spatial index in sync after x, y change."""
+        if hasattr(self, "parent") and self.parent is self.gamemap:
+            self.gamemap.update_entity_location(self)
 
 
 class Actor(Entity):
@@ -174,7 +183,7 @@ class Actor(Entity):
         clone.x = x
         clone.y = y
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         return clone
 
 
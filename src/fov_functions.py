@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import functools
+from typing import Tuple
+
+import numpy as np  # type: ignore
+from tcod.map import compute_fov
+
+
+Window = Tuple[slice, slice]
+
+EMPTY_WINDOW: Window = (slice(0, 0), slice(0, 0))
+
+
+@functools.lru_cache(maxsize=None)
+def disk_mask(radius: int) -> np.ndarray:
+    """
+    Return a (2 * radius + 1) square boolean mask of the cells within `radius` of its center.
+    Masks are cached per radius and must not be modified.
+    """
+    x, y = np.ogrid[-radius : radius + 1, -radius : radius + 1]
+    mask = x * x + y * y <= radius * radius
+    mask.flags.writeable = False
+    return mask
+
+
+def get_window(width: int, height: int, x: int, y: int, radius: int) -> Window:
+    """Return the part of a width x height map within `radius` cells of (x, y) as a 2D array index."""
+    return (
+        slice(max(0, x - radius), min(width, x + radius + 1)),
+        slice(max(0, y - radius), min(height, y + radius + 1)),
+    )
+
+
+def compute_disk_fov(transparency: np.ndarray, x: int, y: int, radius: int) -> Tuple[Window, np.ndarray]:
+    """
+    Compute a circular field of view of `radius` around (x, y).
+
+    Only the bounding window around the viewer is computed, so the cost scales with radius squared
+    instead of with the size of the map.  Returns the window and the boolean field of view within it;
+    apply it with `array[window] = fov`.
+    """
+    width, height = transparency.shape
+    if not (0 <= x < width and 0 <= y < height):
+        return EMPTY_WINDOW, np.zeros((0, 0), dtype=bool)
+
+    window = get_window(width, height, x, y, radius)
+    x0, y0 = window[0].start, window[1].start
+    fov = compute_fov(transparency[window], (x - x0, y - y0), radius=radius)
+    # Clip the cached disk to the part of it which overlaps the map.
+    mx, my = x0 - (x - radius), y0 - (y - radius)
+    fov &= disk_mask(radius)[mx : mx + fov.shape[0], my : my + fov.shape[1]]
+    return window, fov
@@ -1,34 +1,108 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
 
 import numpy as np  # type: ignore
 from tcod.console import Console
-from tcod import libtcodpy
 
 from const import *
 import color
 from entity import Actor, Item
+from pathfinding import FlowField
 import tile_types
+from fov_functions import Window
+from visibility import Visibility
+import zone_io
 
 if TYPE_CHECKING:
     from engine import Engine
     from entity import Entity
 
 
+# Rough memory used by an entity and its components, in bytes.
+ENTITY_MEMORY_ESTIMATE = 4096
+
+
 class GameMap:
     def __init__(
         self, engine: Engine, width: int, height: int, entities: Iterable[Entity] = (),
-        default_fill: tile_types.tile_dt = tile_types.concrete_wall
+        default_fill: int = tile_types.concrete_wall
     ):
         self.engine = engine
         self.width, self.height = width, height
-        self.entities = set(entities)
-            # tiles: what is actually there in the game world
-        self.tiles = np.full((width, height), fill_value=default_fill, dtype=tile_types.tile_dt)
+        self.entities_version = 0  # Incremented whenever entities are added or removed.
+        self.actors_version = 0  # Incremented whenever actors are added or removed, not items.
+        self.entities = entities
+            # tiles: what is actually there in the game world, as tile type ids (see tile_types)
+        self.tiles = np.full((width, height), fill_value=default_fill, dtype=tile_types.tile_id_dt)
+        self.tiles_version = 0  # Incremented whenever tiles change after generation, see set_tile.
             # tiles_memory: what the player remembers seeing / what is currently displayed
-        self.tiles_memory = np.full((width, height), fill_value=default_fill, dtype=tile_types.tile_dt)
+        self.tiles_memory = np.full((width, height), fill_value=default_fill, dtype=tile_types.tile_id_dt)
+        self.default_fill = default_fill
         
+        self.reset_view_arrays()
+        self.explored = np.full(  # Tiles the player has seen before
+            (width, height), fill_value=False, dtype=bool
+        )
+
+        self.downstairs_location = (0, 0)
+        self.upstairs_location = (0, 0)
+
+        # (player x, player y, coming_from) when procgen made this map, see procgen.regenerate_dungeon.
+        self.origin: Optional[Tuple[int, int, int]] = None
+        # The tiles and (entity, fingerprint) pairs generation gave, saves store the differences from them.
+        self.generated_tiles: Optional[np.ndarray] = None
+        self.generated_entities: List[Tuple[Entity, int]] = []
+
+        self._visibility: Optional[Visibility] = None
+        self._flow_field: Optional[FlowField] = None
+        self._flow_field_key: Optional[Tuple[int, int, int, int]] = None
+        self._tile_properties: Dict[str, np.ndarray] = {}
+        self._tile_properties_version = -1
+        self._render_buffers: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._render_list: Optional[Tuple[List[Entity], np.ndarray, np.ndarray]] = None
+        self._render_list_version = -1
+        # Bounds (x0, x1, y0, y1) of the cells which may have changed since the last render, or None.
+        self._render_dirty: Optional[Tuple[int, int, int, int]] = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # The spatial index is rebuilt from the entity set after loading.
+        state["_entities_at"] = None
+        state["_entity_locations"] = None
+        state["_visibility"] = None
+        state["_flow_field"] = state["_flow_field_key"] = None
+        state["_render_buffers"] = state["_render_dirty"] = state["_render_list"] = None
+        state["_tile_properties"] = {}
+        # Loaded zones map their tiles from the zone file, see zone_io.read_zone.
+        for name in ("tiles", "tiles_memory"):
+            if isinstance(state[name], np.memmap):
+                state[name] = np.array(state[name])
+        return state
+
+    def record_baseline(self, origin: Tuple[int, int, int]) -> None:
+        """Remember what generation made this map from `origin`, so it can be saved as its differences from it."""
+        self.origin = origin
+        self.generated_tiles = self.tiles.copy()
+        player = self.engine.player
+        entities = sorted((entity for entity in self.entities if entity is not player), key=lambda e: (e.x, e.y))
+        self.generated_entities = list(zip(entities, zone_io.get_entity_fingerprints(self, entities)))
+
+    def estimate_memory(self) -> int:
+        """Roughly how many bytes this map keeps alive, for the zone cache's budget."""
+        size = sum(value.nbytes for value in self.__dict__.values() if isinstance(value, np.ndarray))
+        if self._visibility is not None:
+            size += self._visibility.light_counts.nbytes
+            size += sum(light.fov.nbytes for light in self._visibility.lights.values())
+        if self._flow_field is not None:
+            size += self._flow_field.distance.nbytes * 3
+        if self._render_buffers is not None:
+            size += sum(buffer.nbytes for buffer in self._render_buffers)
+        return size + len(self._entities) * ENTITY_MEMORY_ESTIMATE
+
+    def reset_view_arrays(self) -> None:
+        """Clear the arrays of what is lit and visible, they are filled in again by the next FOV update."""
+        width, height = self.width, self.height
         self.lit_tiles = np.full(  # Tiles lit up by light sources
             (width, height), fill_value=False, dtype=bool
         )
@@ -41,17 +115,98 @@ class GameMap:
         self.visible = np.full(  # Tiles the player can currently see but are not illuminated
             (width, height), fill_value=False, dtype=bool
         )
-        self.explored = np.full(  # Tiles the player has seen before
-            (width, height), fill_value=False, dtype=bool
-        )
-
-        self.downstairs_location = (0, 0)
-        self.upstairs_location = (0, 0)
 
     @property
     def gamemap(self) -> GameMap:
         return self
 
+    @property
+    def entities(self) -> Set[Entity]:
+        """The set of entities on this map.
+
+        Don't add or remove entities from this set directly, use `add_entity` and `remove_entity` so the
+        spatial index stays up to date.  Assigning a new collection rebuilds the index.
+        """
+        return self._entities
+
+    @entities.setter
+    def entities(self, entities: Iterable[Entity]) -> None:
+        self._entities = set(entities)
+        self._entities_at = None
+        self.entities_version += 1
+        self.actors_version += 1
+
+    @property
+    def entities_at(self) -> Dict[Tuple[int, int], Set[Entity]]:
+        """Index of the entities on this map, keyed by their (x, y) location."""
+        if self._entities_at is None:
+            # Built lazily since entities are not fully unpickled yet when this map is.
+            self._entities_at = {}
+            self._entity_locations: Dict[Entity, Tuple[int, int]] = {}
+            for entity in self._entities:
+                location = (entity.x, entity.y)
+                self._entity_locations[entity] = location
+                self._entities_at.setdefault(location, set()).add(entity)
+        return self._entities_at
+
+    def _index_entity(self, entity: Entity) -> None:
+        entities_at = self.entities_at
+        location = (entity.x, entity.y)
+        self._entity_locations[entity] = location
+        entities_at.setdefault(location, set()).add(entity)
+
+    def _unindex_entity(self, entity: Entity) -> None:
+        entities_at = self.entities_at
+        location = self._entity_locations.pop(entity, None)
+        if location is None:
+            return
+        cell = entities_at[location]
+        cell.discard(entity)
+        if not cell:
+            del entities_at[location]
+
+    def add_entity(self, entity: Entity) -> None:
+        """Add an entity to this map at its current location."""
+        self._unindex_entity(entity)  # In case it was already here under an old location.
+        self._entities.add(entity)
+        self._index_entity(entity)
+        self.entities_version += 1
+        if isinstance(entity, Actor):
+            self.actors_version += 1
+
+    def remove_entity(self, entity: Entity) -> None:
+        """Remove an entity from this map."""
+        self._entities.remove(entity)
+        self._unindex_entity(entity)
+        self.entities_version += 1
+        if isinstance(entity, Actor):
+            self.actors_version += 1
+
+    def update_entity_location(self, entity: Entity) -> None:
+        """Move an entity within the index after its x, y have been changed."""
+        if entity not in self._entities:
+            return
+        self._unindex_entity(entity)
+        self._index_entity(entity)
+
+    @property
+    def visibility(self) -> Visibility:
+        """The cached field of view and light grid state of this map."""
+        if self._visibility is None:
+            self._visibility = Visibility(self)
+        return self._visibility
+
+    def get_flow_field_to(self, x: int, y: int) -> FlowField:
+        """Return a distance map leading to x, y.
+
+        It is computed at most once per turn and shared by everything chasing the same target.
+        """
+        key = (x, y, self.engine.turn_count, self.tiles_version)
+        if key != self._flow_field_key:
+            self._flow_field = FlowField(self, x, y)
+            self._flow_field_key = key
+        return self._flow_field
+
     @property
     def actors(self) -> Iterator[Actor]:
         """Iterate over this maps living actors."""
@@ -65,54 +220,74 @@ class GameMap:
     def items(self) -> Iterator[Item]:
         yield from (entity for entity in self.entities if isinstance(entity, Item))
 
-    def get_entities_at_location(self, location_x: int, location_y: int) -> list:
-        list_entities = []
-        for entity in self.entities:
-            if (
-                entity.x == location_x
-                and entity.y == location_y
-            ):
-                list_entities.append(entity)
-
-        return list_entities
-
-    def get_items_at_location(self, location_x: int, location_y: int) -> list:
-        list_items = []
-        for item in self.entities:
-            if (
-                isinstance(item, Item)
-                and item.x == location_x
-                and item.y == location_y
-            ):
-                list_items.append(item)
-
-        return list_items
+    def get_entities_at_location(self, location_x: int, location_y: int) -> List[Entity]:
+        return list(self.entities_at.get((location_x, location_y), ()))
+
+    def get_items_at_location(self, location_x: int, location_y: int) -> List[Item]:
+        return [
+            item
+            for item in self.entities_at.get((location_x, location_y), ())
+            if isinstance(item, Item)
+        ]
 
     def get_blocking_entity_at_location(self, location_x: int, location_y: int) -> Optional[Entity]:
-        for entity in self.entities:
-            if (
-                entity.blocks_movement
-                and entity.x == location_x
-                and entity.y == location_y
-            ):
+        for entity in self.entities_at.get((location_x, location_y), ()):
+            if entity.blocks_movement:
                 return entity
 
         return None
 
     def get_actor_at_location(self, x: int, y: int) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
+        for actor in self.entities_at.get((x, y), ()):
+            if isinstance(actor, Actor) and actor.is_alive:
                 return actor
 
         return None
 
-    def get_tile_is_staircase_down_at_location(self, x: int, y: int) -> tile_types.tile_dt:
-        return self.tiles[x,y]["stairs_down"]
-    def get_tile_is_staircase_up_at_location(self, x: int, y: int) -> tile_types.tile_dt:
-        return self.tiles[x,y]["stairs_up"]
+    def get_tile_property(self, name: str) -> np.ndarray:
+        """
+        Return a field of tile_dt, such as "walkable", for every tile on the map as a contiguous array.
+
+        The arrays are cached until `tiles_version` changes and must not be modified.
+        """
+        if self._tile_properties_version != self.tiles_version:
+            self._tile_properties.clear()
+            self._tile_properties_version = self.tiles_version
+        array = self._tile_properties.get(name)
+        if array is None:
+            array = self._tile_properties[name] = tile_types.get_property(name)[self.tiles]
+            array.flags.writeable = False
+        return array
+
+    @property
+    def walkable(self) -> np.ndarray:
+        return self.get_tile_property("walkable")
 
-    def get_tile_at_location(self, x: int, y: int) -> tile_types.tile_dt:
-        return self.tiles[x,y]["tileid"]
+    @property
+    def transparent(self) -> np.ndarray:
+        return self.get_tile_property("transparent")
+
+    @property
+    def not_obscuring(self) -> np.ndarray:
+        return self.get_tile_property("not_obscuring")
+
+    @property
+    def fall_through(self) -> np.ndarray:
+        return self.get_tile_property("fall_through")
+
+    def get_tile_is_staircase_down_at_location(self, x: int, y: int) -> bool:
+        return tile_types.get_property("stairs_down")[self.tiles[x, y]]
+    def get_tile_is_staircase_up_at_location(self, x: int, y: int) -> bool:
+        return tile_types.get_property("stairs_up")[self.tiles[x, y]]
+
+    def get_tile_at_location(self, x: int, y: int) -> int:
+        return tile_types.get_property("tileid")[self.tiles[x, y]]
+
+    def set_tile(self, x: int, y: int, tile: int) -> None:
+        """Change the tile at x, y, invalidating anything computed from the old tiles."""
+        self.tiles[x, y] = tile
+        self.tiles_version += 1
+        self.mark_dirty((slice(x, x + 1), slice(y, y + 1)))
 
     def in_bounds(self, x: int, y: int) -> bool:
         """Return True if x and y are inside of the bounds of this map."""
@@ -126,9 +301,40 @@ class GameMap:
             self.explored |= self.visible
             self.explored |= self.obscured_but_visible
     def remove_all_light(self):
-        self.lit_tiles = np.full(  # Tiles that are in the light
-            (self.width, self.height), fill_value=False, order="F"
+        self.visibility.clear_lights()
+
+    def invalidate_render_list(self) -> None:
+        """Sort the entities for rendering again before the next frame, for when an entity's looks change."""
+        self._render_list = None
+
+    def get_render_list(self) -> Tuple[List[Entity], np.ndarray, np.ndarray]:
+        """Return the entities other than the player in the order they are drawn, with their glyphs and colors.
+
+        The list is only sorted again when entities were added or removed, or `invalidate_render_list`
+        was called.
+        """
+        if self._render_list is None or self._render_list_version != self.entities_version:
+            entities = sorted(
+                self.entities - {self.engine.player}, key=lambda x: x.render_order.value*10000000 + x.value * 100000 + x.id
             )
+            chars = np.array([ord(entity.char) for entity in entities], dtype=np.int32)
+            colors = np.array([entity.color for entity in entities], dtype=np.uint8).reshape(-1, 3)
+            self._render_list = (entities, chars, colors)
+            self._render_list_version = self.entities_version
+        return self._render_list
+
+    def mark_dirty(self, window: Optional[Window] = None) -> None:
+        """Tell the renderer that the visibility, light or tiles of `window`, or of the whole map, changed."""
+        if window is None:
+            bounds = (0, self.width, 0, self.height)
+        else:
+            bounds = (window[0].start, window[0].stop, window[1].start, window[1].stop)
+            if bounds[0] >= bounds[1] or bounds[2] >= bounds[3]:
+                return
+        if self._render_dirty is not None:
+            old = self._render_dirty
+            bounds = (min(old[0], bounds[0]), max(old[1], bounds[1]), min(old[2], bounds[2]), max(old[3], bounds[3]))
+        self._render_dirty = bounds
 
     def render(self, console: Console) -> None:
         """
@@ -137,48 +343,84 @@ class GameMap:
         If a tile is in the "visible" array, then draw it with the "light" colors.
         If it isn't, but it's in the "explored" array, then draw it with the "dark" colors.
         Otherwise, the default is "SHROUD".
+
+        The map graphics are kept between frames.  Only the region marked with `mark_dirty` is looked
+        at again: each of its cells gets a state code, and the graphics of the cells whose state or
+        remembered tile changed are gathered from the tile graphics table.  If much of the region
+        changed, it's redrawn as a whole.
         """
-        
-        self.tiles_memory = np.where(self.visible, self.tiles, self.tiles_memory)
-        
-        console.rgb[0 : self.width, 0 : self.height] = np.select(
-            condlist=[self.lit_and_visible, self.visible, self.obscured_but_visible, self.explored],
-            choicelist=[self.tiles_memory["light"], self.tiles_memory["dark"], self.tiles_memory["obscured"], self.tiles_memory["deep"]],
-            default=tile_types.SHROUD,
-        )
+        if self._render_buffers is None:
+            shape = (self.width, self.height)
+            self._render_buffers = (
+                np.full(shape, -1, dtype=np.intp),  # Index into the graphics table of each cell.
+                np.empty(shape, dtype=tile_types.rgba_graphic_dt, order="F"),  # Same layout as the console.
+            )
+            self.mark_dirty()
+        table_index, graphics = self._render_buffers
+
+        if self._render_dirty is not None:
+            x0, x1, y0, y1 = self._render_dirty
+            self._render_dirty = None
+            window = (slice(x0, x1), slice(y0, y1))
+            visible = self.visible[window]
+            memory = self.tiles_memory[window]
+            np.copyto(memory, self.tiles[window], where=visible)
+
+            # Later assignments take priority: lit, then visible, then obscured, then explored.
+            state = np.full(visible.shape, tile_types.STATE_SHROUD, dtype=np.intp)
+            state[self.explored[window]] = tile_types.STATE_DEEP
+            state[self.obscured_but_visible[window]] = tile_types.STATE_OBSCURED
+            state[visible] = tile_types.STATE_DARK
+            state[self.lit_and_visible[window]] = tile_types.STATE_LIGHT
+            new_index = state
+            new_index += memory * tile_types.NUM_STATES
+
+            changed = new_index != table_index[window]
+            table = tile_types.get_graphics_table(rgba=True)
+            if np.count_nonzero(changed) > changed.size // 4:
+                graphics[window] = table.take(new_index)
+                table_index[window] = new_index
+            elif changed.any():
+                changed_index = new_index[changed]
+                graphics[window][changed] = table.take(changed_index)
+                table_index[window][changed] = changed_index
+
+        # Copy as raw bytes, assigning structured arrays field by field is many times slower.
+        void = np.dtype((np.void, graphics.itemsize))
+        console.rgba[0 : self.width, 0 : self.height].view(void)[...] = graphics.view(void)
 
         # draw all other entities
-        entities_sorted_for_rendering = sorted(
-            self.entities - {self.engine.player}, key=lambda x: x.render_order.value*10000000 + x.value * 100000 + x.id
-        )
-        for entity in entities_sorted_for_rendering:
-            bghere = tuple(console.bg[entity.x, entity.y])
-            tile = self.get_tile_at_location(entity.x, entity.y)
-            banned = (DOWN_STAIRCASE, UP_STAIRCASE,)
-            if tile in banned:
-                fgcol = entity.color
-                bgcol = bghere
-            else:
-                if len(self.get_entities_at_location(entity.x, entity.y)) <= 1:
-                    fgcol = entity.color
-                    bgcol = bghere
-                else:
-                    fgcol = color.black
-                    bgcol = color.dkgreen
-            
-            if self.lit_and_visible[entity.x, entity.y]:
-                libtcodpy.console_put_char_ex(
-                    console,
-                    entity.x, entity.y, entity.char, fgcol, bgcol
-                )
-            elif self.obscured_but_visible[entity.x, entity.y]:
-                console.print(
-                    x=entity.x, y=entity.y, string='?', fg=color.gray
-                )
-            elif self.visible[entity.x, entity.y]:
-                console.print(
-                    x=entity.x, y=entity.y, string='?', fg=color.gray
-                )
+        entities, chars, colors = self.get_render_list()
+        if entities:
+            xs = np.fromiter((entity.x for entity in entities), dtype=np.intp, count=len(entities))
+            ys = np.fromiter((entity.y for entity in entities), dtype=np.intp, count=len(entities))
+            on_map = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+            xs, ys, chars, colors = xs[on_map], ys[on_map], chars[on_map], colors[on_map]
+            cells = xs * self.height + ys
+            counts = np.bincount(cells, minlength=self.width * self.height)
+            player = self.engine.player
+            if self.in_bounds(player.x, player.y):
+                counts[player.x * self.height + player.y] += 1
+
+            # Entities are drawn in order, so only the last one on each cell shows.
+            _, last = np.unique(cells[::-1], return_index=True)
+            last = len(cells) - 1 - last
+            xs, ys, chars, colors, cells = xs[last], ys[last], chars[last], colors[last], cells[last]
+
+            lit = self.lit_and_visible[xs, ys]
+            seen = lit | self.obscured_but_visible[xs, ys] | self.visible[xs, ys]
+            # Stacks of entities are highlighted, except on staircases.
+            stacked = (counts[cells] > 1) & ~np.isin(
+                tile_types.get_property("tileid")[self.tiles[xs, ys]], (DOWN_STAIRCASE, UP_STAIRCASE)
+            )
+
+            # Entities which are seen but not lit show up as a gray question mark.
+            glyphs = np.where(lit, chars, ord("?"))
+            fgs = np.where(lit[:, np.newaxis], colors, color.gray)
+            fgs[lit & stacked] = color.black
+            console.ch[xs[seen], ys[seen]] = glyphs[seen]
+            console.fg[xs[seen], ys[seen]] = fgs[seen]
+            console.bg[xs[lit & stacked], ys[lit & stacked]] = color.dkgreen
 
         # draw player lastly
         console.print(
@@ -211,3 +453,13 @@ class GameWorld:
             map_height=self.map_height,
             engine=self.engine
         )
+
+    def regenerate_floor(self, origin: Tuple[int, int, int]) -> GameMap:
+        """Return the map of the current zone as it was first generated, see procgen.regenerate_dungeon."""
+        from procgen import regenerate_dungeon
+        return regenerate_dungeon(
+            map_width=self.map_width,
+            map_height=self.map_height,
+            engine=self.engine,
+            origin=origin
+        )
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Run the game without a window, for measuring simulation throughput and for soak testing on machines
+without a display.
+
+The player is driven either by a script of key presses, fed through the same event handlers the
+game uses, or by a simple built-in AI which wanders around, fights and takes stairs.  Nothing is
+ever rendered and no images or tilesets are loaded.
+
+    python3 headless.py --turns 2000 --seed 1
+    python3 headless.py --script "UP UP LEFT shift+PERIOD" --turns 100
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import tcod
+
+from actions import Action, BumpAction, TakeStairsDownAction, TakeStairsUpAction, WaitAction
+from components.ai import HostileEnemy
+from engine import Engine
+import entity_factories
+import input_handlers
+import setup_game
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+
+DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1))
+
+
+class ScriptedPlayer:
+    """
+    Plays a script of key presses, over and over.
+
+    The script is a whitespace separated list of tcod KeySym names such as "UP", "KP_5" or "g",
+    optionally prefixed with "shift+", e.g. "shift+PERIOD" to take the stairs down.
+    """
+
+    def __init__(self, script: str):
+        self.events = [self.parse_key(word) for word in script.split()]
+        if not self.events:
+            raise ValueError("The script has no keys in it.")
+
+    @staticmethod
+    def parse_key(word: str) -> tcod.event.KeyDown:
+        mod = tcod.event.Modifier.NONE
+        if word.lower().startswith("shift+"):
+            mod = tcod.event.Modifier.SHIFT
+            word = word[len("shift+"):]
+        try:
+            sym = tcod.event.KeySym[word]
+        except KeyError:
+            raise ValueError(f"Unknown key in script: {word!r}") from None
+        return tcod.event.KeyDown(0, sym, mod)
+
+
+class AutoPlayer:
+    """
+    A simple AI for the player: attacks adjacent enemies, and otherwise walks in straight lines in
+    random directions.  After `turns_per_floor` turns on a floor it heads for the stairs down.
+    """
+
+    def __init__(self, rng: random.Random, turns_per_floor: int = 200, stairs_chance: float = 0.1):
+        self.rng = rng
+        self.turns_per_floor = turns_per_floor
+        self.stairs_chance = stairs_chance
+        self.direction = rng.choice(DIRECTIONS)
+        self.game_map: Optional[GameMap] = None
+        self.floor_actions = 0
+
+    def get_action(self, engine: Engine) -> Action:
+        player = engine.player
+        game_map = engine.game_map
+        if game_map is not self.game_map:
+            self.game_map = game_map
+            self.floor_actions = 0
+        self.floor_actions += 1
+
+        if player.level.requires_level_up:
+            self.rng.choice(
+                (player.level.increase_zeal, player.level.increase_guts,
+                 player.level.increase_tech, player.level.increase_luck)
+            )()
+
+        for dx, dy in DIRECTIONS:
+            actor = game_map.get_actor_at_location(player.x + dx, player.y + dy)
+            if actor and isinstance(actor.ai, HostileEnemy):
+                return BumpAction(player, True, dx, dy)
+
+        if self.rng.random() < self.stairs_chance:
+            if game_map.get_tile_is_staircase_down_at_location(player.x, player.y):
+                return TakeStairsDownAction(player, True)
+            if game_map.get_tile_is_staircase_up_at_location(player.x, player.y):
+                return TakeStairsUpAction(player, True)
+
+        if self.floor_actions > self.turns_per_floor:
+            if (player.x, player.y) == game_map.downstairs_location:
+                return TakeStairsDownAction(player, True)
+            step = game_map.get_flow_field_to(*game_map.downstairs_location).get_step(player.x, player.y)
+            if step:
+                return BumpAction(player, True, step[0] - player.x, step[1] - player.y)
+
+        open_directions = [
+            (dx, dy) for dx, dy in DIRECTIONS
+            if game_map.in_bounds(player.x + dx, player.y + dy)
+            and game_map.walkable[player.x + dx, player.y + dy]
+            and not game_map.get_blocking_entity_at_location(player.x + dx, player.y + dy)
+        ]
+        if not open_directions:
+            return WaitAction(player, True)
+        if self.direction not in open_directions or self.rng.random() < 0.05:
+            self.direction = self.rng.choice(open_directions)
+        return BumpAction(player, True, *self.direction)
+
+
+def run(engine: Engine, turns: int, script: Optional[str] = None, immortal: bool = False,
+        rng: Optional[random.Random] = None) -> Tuple[int, float]:
+    """Play `turns` turns, or until the player dies, and return (turns played, seconds taken)."""
+    start_turn = engine.turn_count
+    start_time = time.perf_counter()
+
+    def keep_playing() -> bool:
+        if immortal:
+            engine.player.fighter.hp = engine.player.fighter.max_hp
+        return engine.player.is_alive and engine.turn_count - start_turn < turns
+
+    if script is not None:
+        handler: input_handlers.BaseEventHandler = input_handlers.MainGameEventHandler(engine)
+        events = ScriptedPlayer(script).events
+        while keep_playing():
+            turn_count = engine.turn_count
+            for event in events:
+                if not keep_playing():
+                    break
+                handler = handler.handle_events(event)
+            if engine.turn_count == turn_count:
+                break  # The script doesn't make any progress.
+    else:
+        handler = input_handlers.EventHandler(engine)
+        auto_player = AutoPlayer(rng or random.Random())
+        idle_actions = 0
+        while keep_playing():
+            if handler.handle_action(auto_player.get_action(engine)):
+                idle_actions = 0
+            else:
+                idle_actions += 1
+                if idle_actions > 100:
+                    handler.handle_action(WaitAction(engine.player, True))  # Stuck, let time pass.
+
+    return engine.turn_count - start_turn, time.perf_counter() - start_time
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=1000, help="number of turns to play")
+    parser.add_argument("--seed", type=int, help="seed for the game and the AI player")
+    parser.add_argument("--script", help="play these key presses in a loop instead of using the AI player")
+    parser.add_argument("--immortal", action="store_true", help="keep the player's health topped up")
+    parser.add_argument("--save-dir", help="directory for zone saves, a temporary directory by default")
+    parser.add_argument("--verbose", action="store_true", help="show the game's own console output")
+    parser.add_argument(
+        "--pregen", action="store_true",
+        help="generate the next floors ahead in a worker process, runs are no longer reproducible with a seed",
+    )
+    args = parser.parse_args(argv)
+
+    entity_factories.initialize_all_weapons()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        engine = setup_game.new_game(seed=args.seed)
+        engine.save_dir = args.save_dir or stack.enter_context(tempfile.TemporaryDirectory())
+        # Whether a floor generated ahead is ready in time varies, and it changes the order entities act in.
+        if args.pregen:
+            engine.pregenerator.workers = setup_game.PREGEN_WORKERS
+            stack.callback(engine.pregenerator.shutdown)
+        played, seconds = run(engine, args.turns, args.script, args.immortal, random.Random(args.seed))
+        engine.zone_writer.close()  # Before the save directory goes away.
+
+    outcome = "alive" if engine.player.is_alive else "dead"
+    print(
+        f"{played} turns in {seconds:.2f}s ({played / max(seconds, 1e-9):.1f} turns/sec), "
+        f"zone {tuple(engine.world_location)}, {len(engine.game_map.entities)} entities, player {outcome}"
+    )
+    if not engine.player.is_alive and args.immortal:
+        sys.exit(1)  # Even an immortal player died, something went wrong.
+
+
+if __name__ == "__main__":
+    main()
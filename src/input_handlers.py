@@ -3,21 +3,24 @@ from __future__ import annotations
 import os
 import shutil
 
-from typing import Callable, Optional, Tuple, TYPE_CHECKING, Union
+from typing import Callable, Iterable, List, Optional, Tuple, TYPE_CHECKING, Union
 
 import tcod
 from tcod import libtcodpy
 
 from const import *
 import actions
+from message_log import MessageLog
 from actions import (
     Action,
     BumpAction,
     PickupAction,
+    RestAction,
     WaitAction,
 )
 import color
 import exceptions
+import profiling
 
 if TYPE_CHECKING:
     from engine import Engine
@@ -56,6 +59,8 @@ WAIT_KEYS = {
     tcod.event.KeySym.CLEAR,
 }
 
+REST_TURNS = 100  # The most turns the rest command waits for.
+
 CONFIRM_KEYS = {
     tcod.event.KeySym.RETURN,
     tcod.event.KeySym.KP_ENTER,
@@ -70,11 +75,34 @@ MainGameEventHandler will become the active handler.
 """
 
 
+# Events which may change what is on screen.  Mouse motion only does if the mouse moves to another
+# tile, which the handlers check for themselves.
+REDRAW_EVENTS = (tcod.event.KeyDown, tcod.event.MouseButtonDown, tcod.event.WindowEvent)
+
+
+def coalesce_mouse_motion(events: Iterable[tcod.event.Event]) -> List[tcod.event.Event]:
+    """Return the events with each run of consecutive MouseMotion events reduced to its last one."""
+    coalesced: List[tcod.event.Event] = []
+    for event in events:
+        if isinstance(event, tcod.event.MouseMotion) and coalesced and isinstance(coalesced[-1], tcod.event.MouseMotion):
+            coalesced[-1] = event
+        else:
+            coalesced.append(event)
+    return coalesced
+
+
 class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
+    # Whether the screen needs to be drawn again, the main loop skips frames while this is False.
+    # New handlers always start dirty.
+    dirty = True
+
     def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
         """Handle an event and return the next active event handler."""
+        if isinstance(event, REDRAW_EVENTS):
+            self.dirty = True
         state = self.dispatch(event)
         if isinstance(state, BaseEventHandler):
+            state.dirty = True
             return state
         assert not isinstance(state, Action), f"{self!r} can not handle actions."
         return self
@@ -119,8 +147,11 @@ class EventHandler(BaseEventHandler):
 
     def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
         """Handle events for input handlers with an engine."""
+        if isinstance(event, REDRAW_EVENTS):
+            self.dirty = True
         action_or_state = self.dispatch(event)
         if isinstance(action_or_state, BaseEventHandler):
+            action_or_state.dirty = True
             return action_or_state
         if self.handle_action(action_or_state):
             # A valid action was performed.
@@ -140,20 +171,26 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
 
+        timer = profiling.timer
         try:
-            action.perform()
+            with timer.measure("perform"):
+                action.perform()
         except exceptions.Impossible as exc:
             self.engine.message_log.add_message(exc.args[0], color.impossible)
             return False  # Skip enemy turn on exceptions.
 
-        self.engine.handle_ai_turns()
+        with timer.measure("ai"):
+            self.engine.handle_ai_turns()
 
-        self.engine.update_fov()
+        with timer.measure("fov"):
+            self.engine.update_fov()
         return True
 
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
         if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+            if self.engine.mouse_location != (event.tile.x, event.tile.y):
+                self.engine.mouse_location = event.tile.x, event.tile.y
+                self.dirty = True
 
     def on_render(self, console: tcod.Console) -> None:
         self.engine.render(console)
@@ -590,11 +627,15 @@ class MainGameEventHandler(EventHandler):
             action = BumpAction(player, True, dx, dy)
         elif key in WAIT_KEYS:
             action = WaitAction(player, True)
+        elif key == tcod.event.KeySym.z:
+            action = RestAction(player, True, REST_TURNS)
 
         elif key == tcod.event.KeySym.ESCAPE:
             raise SystemExit()
         elif key == tcod.event.KeySym.v:
             return HistoryViewer(self.engine)
+        elif key == tcod.event.KeySym.F3:
+            profiling.timer.toggle_overlay()
 
         elif key == tcod.event.KeySym.g:
             action = PickupAction(player, True)
@@ -638,12 +679,23 @@ CURSOR_Y_KEYS = {
 
 
 class HistoryViewer(EventHandler):
-    """Print the history on a larger window which can be navigated."""
+    """Print the history on a larger window which can be navigated.
+
+    The history starts out with the recent messages in memory.  Older ones are paged in from the
+    message archive a block at a time as the cursor reaches the top.
+    """
 
     def __init__(self, engine: Engine):
         super().__init__(engine)
-        self.log_length = len(engine.message_log.messages)
-        self.cursor = self.log_length - 1
+        self.history = MessageLog()
+        self.history.prepend(list(engine.message_log.messages))
+        self.archive = engine.message_log.archive
+        self.next_block = len(self.archive) - 1 if self.archive else -1
+        # The cursor is the line shown at the bottom.  The log is wrapped to the width of the
+        # window, which is only known once it's rendered.
+        self.width = 0
+        self.log_length = 0
+        self.cursor: Optional[int] = None
 
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)  # Draw the main state as the background.
@@ -657,20 +709,39 @@ class HistoryViewer(EventHandler):
         )
 
         # Render the message log using the cursor parameter.
-        self.engine.message_log.render_messages(
+        self.width = log_console.width - 2
+        self.log_length = self.history.line_count(self.width)
+        if self.cursor is None:
+            self.cursor = self.log_length - 1
+        self.history.render_lines(
             log_console,
             1,
             1,
-            log_console.width - 2,
+            self.width,
             log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            self.cursor,
         )
         log_console.blit(console, 3, 3)
 
+    def load_older_messages(self) -> bool:
+        """Page in the next older block of messages from the archive.  Returns False if there are none left."""
+        if self.next_block < 0:
+            return False
+        self.history.prepend(self.archive.read_block(self.next_block))
+        self.next_block -= 1
+        log_length = self.history.line_count(self.width)
+        self.cursor += log_length - self.log_length
+        self.log_length = log_length
+        return True
+
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[MainGameEventHandler]:
         # Fancy conditional movement to make it feel right.
+        if self.cursor is None and (event.sym in CURSOR_Y_KEYS or event.sym in (tcod.event.KeySym.HOME, tcod.event.KeySym.END)):
+            return None  # Not rendered yet.
         if event.sym in CURSOR_Y_KEYS:
             adjust = CURSOR_Y_KEYS[event.sym]
+            while adjust < 0 and self.cursor + adjust < 0 and self.load_older_messages():
+                pass
             if adjust < 0 and self.cursor == 0:
                 # Only move from the top to the bottom when you're on the edge.
                 self.cursor = self.log_length - 1
@@ -681,6 +752,8 @@ class HistoryViewer(EventHandler):
                 # Otherwise move while staying clamped to the bounds of the history log.
                 self.cursor = max(0, min(self.cursor + adjust, self.log_length - 1))
         elif event.sym == tcod.event.KeySym.HOME:
+            while self.load_older_messages():
+                pass
             self.cursor = 0  # Move directly to the top message.
         elif event.sym == tcod.event.KeySym.END:
             self.cursor = self.log_length - 1  # Move directly to the last message.
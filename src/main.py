@@ -5,6 +5,7 @@ import tcod
 
 import color
 import exceptions
+import profiling
 import setup_game
 import input_handlers
 import entity_factories
@@ -13,10 +14,18 @@ import entity_factories
 def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
     """If the current event handler has an active Engine then save it."""
     if isinstance(handler, input_handlers.EventHandler):
+        handler.engine.pregenerator.shutdown()  # Quitting, the zones generated ahead won't be used.
         handler.engine.save_as(filename)
         print("Game saved.")
 
 
+def close_game(handler: input_handlers.BaseEventHandler) -> None:
+    """Stop the worker processes and zone writer thread of the current Engine, if any."""
+    if isinstance(handler, input_handlers.EventHandler):
+        handler.engine.pregenerator.shutdown()
+        handler.engine.zone_writer.close()
+
+
 def main() -> None:
     screen_width = 80
     screen_height = 48
@@ -38,12 +47,18 @@ def main() -> None:
         root_console = context.new_console(screen_width, screen_height, magnification=1, order="F")
         try:
             while True:
-                root_console.clear()
-                handler.on_render(console=root_console)
-                context.present(root_console, keep_aspect=True, integer_scaling=True)
+                # Only draw a frame when something on screen has changed.
+                if handler.dirty:
+                    handler.dirty = False
+                    with profiling.timer.measure("render"):
+                        root_console.clear()
+                        handler.on_render(console=root_console)
+                    with profiling.timer.measure("present"):
+                        context.present(root_console, keep_aspect=True, integer_scaling=True)
 
                 try:
-                    for event in tcod.event.wait():
+                    # Only the last of a burst of mouse motion events matters.
+                    for event in input_handlers.coalesce_mouse_motion(tcod.event.wait()):
                         context.convert_event(event)
                         handler = handler.handle_events(event)
                 except Exception:  # Handle exceptions in game.
@@ -53,6 +68,7 @@ def main() -> None:
                         handler.engine.message_log.add_message(
                             traceback.format_exc(), color.error
                         )
+                    handler.dirty = True
         except exceptions.QuitWithoutSaving:
             raise
         except SystemExit:  # Save and quit.
@@ -61,6 +77,8 @@ def main() -> None:
         except BaseException:  # Save on any other unexpected exception.
             save_game(handler, "../sav/game.sav")
             raise
+        finally:
+            close_game(handler)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,12 @@
-from typing import Iterable, List, Reversible, Tuple
+import bisect
+import itertools
+import os
+import pickle
+import struct
+import tempfile
+from typing import Dict, Iterable, List, Optional, Reversible, Tuple
 import textwrap
+import zlib
 
 import tcod
 
@@ -10,7 +17,22 @@ class Message:
     def __init__(self, text: str, fg: Tuple[int, int, int]):
         self.plain_text = text
         self.fg = fg
-        self.count = 1
+        self._count = 1
+        self._lines: Dict[int, List[str]] = {}  # width: wrapped lines
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_lines"] = {}
+        return state
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @count.setter
+    def count(self, value: int) -> None:
+        self._count = value
+        self._lines.clear()  # The count is part of the text.
 
     @property
     def full_text(self) -> str:
@@ -19,10 +41,105 @@ class Message:
             return f"{self.plain_text} (x{self.count})"
         return self.plain_text
 
+    def get_lines(self, width: int) -> List[str]:
+        """Return the full text wrapped to `width`, the result is cached per width."""
+        lines = self._lines.get(width)
+        if lines is None:
+            lines = self._lines[width] = list(MessageLog.wrap(self.full_text, width))
+        return lines
+
+
+MAX_MESSAGES = 1000  # Recent messages kept in memory.
+ARCHIVE_BLOCK_SIZE = 250  # Older messages are moved to the archive this many at a time.
+
+# Each archive block is this header followed by the compressed messages.
+BLOCK_HEADER = struct.Struct("<II")  # compressed size, number of messages
+
+
+class MessageArchive:
+    """
+    An append-only file of old messages, in zlib compressed blocks which can be read back one at a time.
+
+    The file is created in `directory` by the first block, under a name no other archive has, so games
+    sharing a save directory never write over each other's history.  Only `size` bytes of it belong to
+    the archive: anything after it was written after the game was last saved, and is overwritten by the
+    next block.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self.size = 0
+        self._offsets: Optional[List[int]] = None  # Offset of each block, read from the file when needed.
+
+    def __getstate__(self) -> dict:
+        return {"directory": self.directory, "path": self.path, "size": self.size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._offsets = None
+
+    @property
+    def offsets(self) -> List[int]:
+        if self._offsets is None:
+            self._offsets = []
+            if self.size:
+                with open(self.path, "rb") as f:
+                    offset = 0
+                    while offset < self.size:
+                        self._offsets.append(offset)
+                        f.seek(offset)
+                        length, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                        offset += BLOCK_HEADER.size + length
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def append(self, messages: List[Message]) -> None:
+        """Write the messages to the end of the archive as a new block."""
+        data = zlib.compress(pickle.dumps([(m.plain_text, m.fg, m.count) for m in messages]))
+        offsets = self.offsets
+        if self.path is None:
+            fd, self.path = tempfile.mkstemp(prefix="messages_", suffix=".arc", dir=self.directory)
+            f = os.fdopen(fd, "r+b")
+        else:
+            f = open(self.path, "r+b")
+        with f:
+            f.seek(self.size)
+            f.truncate()
+            f.write(BLOCK_HEADER.pack(len(data), len(messages)))
+            f.write(data)
+        offsets.append(self.size)
+        self.size += BLOCK_HEADER.size + len(data)
+
+    def read_block(self, index: int) -> List[Message]:
+        """Return the messages of a block, the oldest block is 0."""
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[index])
+            length, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            data = f.read(length)
+        messages = []
+        for text, fg, count in pickle.loads(zlib.decompress(data)):
+            message = Message(text, fg)
+            message.count = count
+            messages.append(message)
+        return messages
+
 
 class MessageLog:
-    def __init__(self) -> None:
+    def __init__(self, max_messages: int = MAX_MESSAGES) -> None:
         self.messages: List[Message] = []
+        self.max_messages = max_messages
+        # Older messages are moved here, or dropped if there is no archive.
+        self.archive: Optional[MessageArchive] = None
+        # width: the number of lines up to and including each message, when wrapped to that width.
+        self._line_ends: Dict[int, List[int]] = {}
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_line_ends"] = {}
+        return state
 
     def add_message(
         self, text: str, fg: Tuple[int, int, int] = color.white, *, stack: bool = True,
@@ -36,8 +153,31 @@ class MessageLog:
         """
         if stack and self.messages and text == self.messages[-1].plain_text:
             self.messages[-1].count += 1
+            for line_ends in self._line_ends.values():
+                del line_ends[len(self.messages) - 1:]  # Its line count may have changed.
         else:
             self.messages.append(Message(text, fg))
+            if len(self.messages) > self.max_messages + ARCHIVE_BLOCK_SIZE:
+                self._archive_oldest()
+
+    def _archive_oldest(self) -> None:
+        """Move the oldest messages out of memory, into the archive if there is one."""
+        oldest = self.messages[:ARCHIVE_BLOCK_SIZE]
+        del self.messages[:ARCHIVE_BLOCK_SIZE]
+        self._line_ends.clear()
+        if self.archive is not None:
+            self.archive.append(oldest)
+
+    def prepend(self, messages: List[Message]) -> None:
+        """Add older messages before the ones in this log, e.g. ones read back from the archive.
+
+        Only the new messages are wrapped, the line index of the others is shifted past them.
+        """
+        self.messages[:0] = messages
+        for width, line_ends in self._line_ends.items():
+            ends = list(itertools.accumulate(len(message.get_lines(width)) for message in messages))
+            shift = ends[-1] if ends else 0
+            line_ends[:] = ends + [end + shift for end in line_ends]
 
     def render(
         self, console: tcod.console.Console, x: int, y: int, width: int, height: int,
@@ -49,6 +189,49 @@ class MessageLog:
         """
         self.render_messages(console, x, y, width, height, self.messages)
 
+    def get_line_ends(self, width: int) -> List[int]:
+        """Return the number of lines up to and including each message when wrapped to `width`.
+
+        This is kept up to date as messages are added, so only new messages are ever wrapped.
+        """
+        line_ends = self._line_ends.setdefault(width, [])
+        total = line_ends[-1] if line_ends else 0
+        for message in self.messages[len(line_ends):]:
+            total += len(message.get_lines(width))
+            line_ends.append(total)
+        return line_ends
+
+    def line_count(self, width: int) -> int:
+        """Return the number of lines of the whole log wrapped to `width`."""
+        line_ends = self.get_line_ends(width)
+        return line_ends[-1] if line_ends else 0
+
+    def render_lines(
+        self, console: tcod.console.Console, x: int, y: int, width: int, height: int, last_line: int,
+    ) -> None:
+        """Render the log wrapped to `width`, with line number `last_line` at the bottom of the area.
+
+        The message holding that line is found with a binary search, so only the lines shown are
+        looked at.
+        """
+        line_ends = self.get_line_ends(width)
+        if not line_ends or last_line < 0:
+            return
+        last_line = min(last_line, line_ends[-1] - 1)
+        index = bisect.bisect_right(line_ends, last_line)
+        skip = line_ends[index] - 1 - last_line  # Lines of this message below the bottom of the area.
+        y_offset = height - 1
+        while index >= 0:
+            message = self.messages[index]
+            lines = message.get_lines(width)
+            for line in reversed(lines[: len(lines) - skip]):
+                console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
+                y_offset -= 1
+                if y_offset < 0:
+                    return  # No more space to print messages.
+            skip = 0
+            index -= 1
+
     @staticmethod
     def wrap(string: str, width: int) -> Iterable[str]:
         """Return a wrapped text message."""
@@ -75,7 +258,7 @@ class MessageLog:
         y_offset = height - 1
 
         for message in reversed(messages):
-            for line in reversed(list(cls.wrap(message.full_text, width))):
+            for line in reversed(message.get_lines(width)):
                 console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
                 y_offset -= 1
                 if y_offset < 0:
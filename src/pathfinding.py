@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+import tcod
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+
+# Neighbor offsets in the order they are preferred when distances are tied: cardinals first.
+NEIGHBORS = (
+    (0, -1), (0, 1), (-1, 0), (1, 0),
+    (-1, -1), (1, -1), (-1, 1), (1, 1),
+)
+
+# Cost of stepping cardinally and diagonally, as used by every pathfinder in the game.
+CARDINAL_COST = 2
+DIAGONAL_COST = 3
+
+
+def get_cost_array(game_map: GameMap) -> np.ndarray:
+    """Return the movement cost of each tile on the map.  Zero means the tile can't be walked on."""
+    # Copy the walkable array.
+    cost = np.array(game_map.walkable, dtype=np.int8)
+
+    for (x, y), entities in game_map.entities_at.items():
+        for entity in entities:
+            # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
+            if entity.blocks_movement and cost[x, y]:
+                # Add to the cost of a blocked position.
+                # A lower number means more enemies will crowd behind each other in
+                # hallways.  A higher number means enemies will take longer paths in
+                # order to surround the player.
+                cost[x, y] += 10
+    return cost
+
+
+class FlowField:
+    """
+    A Dijkstra distance map leading to a single target.
+
+    It's computed once and then shared by every actor chasing that target: each of them just steps to
+    its neighboring tile with the lowest distance.
+    """
+
+    def __init__(self, game_map: GameMap, target_x: int, target_y: int):
+        self.target = (target_x, target_y)
+        cost = get_cost_array(game_map)
+        self.distance = tcod.path.maxarray(cost.shape, dtype=np.int32)
+        self.distance[target_x, target_y] = 0
+        tcod.path.dijkstra2d(self.distance, cost, CARDINAL_COST, DIAGONAL_COST, out=self.distance)
+        self._padded_distance: Optional[np.ndarray] = None
+
+    def get_step(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Return the next tile to step to from x, y to get closer to the target, if there is one.
+
+        That's the neighbor with the lowest distance plus the cost of the step, diagonal steps costing
+        more than cardinal ones.  The cost of x, y itself is left out, it's raised by whoever stands there.
+        """
+        width, height = self.distance.shape
+        here = self.distance[x, y]
+        best = None
+        step = None
+        for dx, dy in NEIGHBORS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and self.distance[nx, ny] < here:
+                via = int(self.distance[nx, ny]) + (DIAGONAL_COST if dx and dy else CARDINAL_COST)
+                if best is None or via < best:
+                    best = via
+                    step = nx, ny
+        return step
+
+    def get_steps(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Vectorized `get_step` for many positions at once.
+
+        Returns the x and y arrays of the next tiles, and a boolean array which is False for the
+        positions with nowhere better to go.
+        """
+        if self._padded_distance is None:
+            # Pad the edges with unreachable tiles so neighbors never need bounds checks, in 64 bits so
+            # adding step costs to unreachable distances can't overflow.
+            self._padded_distance = np.pad(
+                self.distance.astype(np.int64), 1, constant_values=np.iinfo(self.distance.dtype).max
+            )
+        padded = self._padded_distance
+        here = self.distance[xs, ys]
+        best = np.full(len(xs), np.iinfo(np.int64).max)
+        step_x, step_y = xs.copy(), ys.copy()
+        for dx, dy in NEIGHBORS:
+            neighbor = padded[xs + 1 + dx, ys + 1 + dy]
+            via = neighbor + (DIAGONAL_COST if dx and dy else CARDINAL_COST)
+            better = (neighbor < here) & (via < best)
+            best = np.where(better, via, best)
+            step_x[better] = xs[better] + dx
+            step_y[better] = ys[better] + dy
+        return step_x, step_y, (step_x != xs) | (step_y != ys)
@@ -0,0 +1,143 @@
+"""
+Speculative generation of the zones above and below the current one, in worker processes.
+
+Generating a deep floor takes long enough to be felt on the stairs.  While the player explores a
+floor the zones next to it are generated in the background, from where the player is expected to
+arrive: the stairs leading there.  A zone generated ahead is only used if the player does arrive
+from there, anything else and it's generated as usual.
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+import copy
+import multiprocessing
+import os
+import random
+import tempfile
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+import entity_factories
+import zone_io
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from game_map import GameMap
+
+
+# world location, world seed, origin (player x, player y, coming_from): what generation depends on.
+PregenKey = Tuple[Tuple[int, int], int, Tuple[int, int, int]]
+# The map, where the player was placed on it and the state of `random` after generating it.
+PregenResult = Tuple[zone_io.ZoneSnapshot, Tuple[int, int], Any]
+
+
+def _initialize_worker() -> None:
+    entity_factories.initialize_all_weapons()
+
+
+def _generate(map_width: int, map_height: int, key: PregenKey) -> PregenResult:
+    """Generate a zone in a worker process, the same way GameWorld.generate_floor would."""
+    import procgen
+    from engine import Engine
+
+    location, world_seed, (x, y, coming_from) = key
+    player = copy.deepcopy(entity_factories.player)
+    player.x, player.y = x, y
+    engine = Engine(player=player, save_dir=tempfile.gettempdir())
+    engine.world_seed = world_seed
+    engine.world_location = list(location)
+    engine.coming_from = coming_from
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        game_map = procgen.generate_dungeon(map_width, map_height, engine)
+    return zone_io.snapshot_generated(game_map), (player.x, player.y), random.getstate()
+
+
+class Pregenerator:
+    """
+    Generates zones ahead of the player in a process pool.  With 0 `workers`, the default, it does nothing.
+
+    Whoever sets `workers` shuts the pool down when done with the game.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.futures: Dict[PregenKey, Future] = {}
+
+    @staticmethod
+    def get_key(engine: Engine, location: Tuple[int, int], x: int, y: int, coming_from: int) -> PregenKey:
+        return location, engine.world_seed, (x, y, coming_from)
+
+    def schedule(self, engine: Engine) -> None:
+        """Start generating the unexplored zones next to the current one, dropping older guesses."""
+        if self.workers <= 0:
+            return
+        game_map = engine.game_map
+        wx, wy = engine.world_location
+        wanted = []
+        for dy, coming_from, (x, y) in ((1, -1, game_map.downstairs_location), (-1, 1, game_map.upstairs_location)):
+            location = (wx, wy + dy)
+            if location[1] < 0 or location in engine.explored_zones or location in engine.zone_cache:
+                continue
+            wanted.append(self.get_key(engine, location, x, y, coming_from))
+
+        for key in list(self.futures):
+            if key not in wanted:
+                self.futures.pop(key).cancel()
+        for key in wanted:
+            if key not in self.futures:
+                try:
+                    self.futures[key] = self._get_executor().submit(
+                        _generate, engine.game_world.map_width, engine.game_world.map_height, key
+                    )
+                except (BrokenProcessPool, OSError, RuntimeError):
+                    # Worker processes can't be started here, generate every zone on the spot instead.
+                    self.shutdown()
+                    self.workers = 0
+                    return
+
+    def adopt(self, engine: Engine) -> Optional[GameMap]:
+        """Return the zone at the world location if it was generated ahead from where the player is.
+
+        The map is set up as generate_dungeon would have: the player is placed on it, the zone marked
+        explored and `random` left in the same state.
+        """
+        player = engine.player
+        location = (engine.world_location[0], engine.world_location[1])
+        future = self.futures.pop(self.get_key(engine, location, player.x, player.y, engine.coming_from), None)
+        if future is None or future.cancel():
+            return None  # Not guessed, or not started yet: generating it here is as fast.
+        try:
+            snapshot, (x, y), random_state = future.result()
+        except Exception:
+            return None  # Generate it here instead, where any error is seen.
+        game_map = zone_io.read_generated(snapshot, engine)
+        player.place(x, y, game_map)
+        engine.explored_zones[location] = game_map.seed_xy
+        random.setstate(random_state)
+        return game_map
+
+    def wait(self) -> None:
+        """Wait for every zone being generated ahead."""
+        for future in list(self.futures.values()):
+            if not future.cancelled():
+                future.exception()
+
+    def shutdown(self) -> None:
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned rather than forked, the game has threads running (see zone_io.ZoneWriter).
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialize_worker,
+            )
+        return self._executor
@@ -138,7 +138,7 @@ def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int,)
         x = random.randint(room.x1 + 1, room.x2 - 1)
         y = random.randint(room.y1 + 1, room.y2 - 1)
 
-        if (dungeon.in_bounds(x,y) and not any(entity.x == x and entity.y == y for entity in dungeon.entities)):
+        if (dungeon.in_bounds(x,y) and not dungeon.get_entities_at_location(x, y)):
             entity.spawn(dungeon, x, y)
 
 
@@ -174,6 +174,7 @@ def generate_dungeon(map_width, map_height, engine) -> GameMap:
 
     # set the seed to the correct value based on player location
     print("creating new zone: ({}, {})".format(engine.world_location[0], engine.world_location[1]))
+    origin = (engine.player.x, engine.player.y, engine.coming_from)
     random.seed(engine.world_location[0]*10000 + engine.world_location[1]*100 + engine.world_seed)
     
     if engine.world_location[1] == 0:
@@ -183,11 +184,35 @@ def generate_dungeon(map_width, map_height, engine) -> GameMap:
     else: # default (should never get here...)
         dungeon = _generate_warehouse(map_width, map_height, engine)
     
+    # The tiles were written directly, drop anything computed from them during generation.
+    dungeon.tiles_version += 1
+    dungeon.record_baseline(origin)
+
     #print("seeding new zone: ", dungeon.seed_xy)
     engine.explored_zones.update({(engine.world_location[0],engine.world_location[1]) : dungeon.seed_xy})
 
     return dungeon
 
+def regenerate_dungeon(map_width, map_height, engine, origin) -> GameMap:
+    """
+    Generate the zone at the player's location again, exactly as generate_dungeon first did.
+
+    Generation depends on where the player arrived from, `origin` is the (x, y, coming_from) of the
+    first time.  The player's position, coming_from and the state of `random` are left as they were.
+    """
+    player = engine.player
+    position = (player.x, player.y)
+    coming_from = engine.coming_from
+    random_state = random.getstate()
+    player.x, player.y, engine.coming_from = origin
+    try:
+        dungeon = generate_dungeon(map_width, map_height, engine)
+    finally:
+        engine.coming_from = coming_from
+        random.setstate(random_state)
+    player.move_to(*position)
+    return dungeon
+
 def _generate_superhighway(map_width, map_height, engine) -> GameMap:
     """Generate a superhighway style map."""
     
@@ -248,7 +273,7 @@ def _generate_warehouse(map_width, map_height, engine) -> GameMap:
     dungeon.tiles[rooms[-1].center] = tile_types.down_stairs
     dungeon.downstairs_location = rooms[-1].center
 
-    if (engine.coming_from == -1 and (dungeon.tiles[player.x,player.y]['stairs_up'] == False)):
+    if (engine.coming_from == -1 and not dungeon.get_tile_is_staircase_up_at_location(player.x, player.y)):
         dungeon.tiles[player.x,player.y] = tile_types.up_stairs
         
     # Place player in the dungeon
@@ -304,9 +329,10 @@ def __make_rooms(
 
         # Build up walls around the room
         if walls:
+            tileids = tile_types.get_property("tileid")
             dungeon.tiles[new_room.outer][np.logical_and(
-                dungeon.tiles[new_room.outer]['tileid'] != floor_tile['tileid'],
-                dungeon.tiles[new_room.outer]['tileid'] != tunnel_tile['tileid']
+                tileids[dungeon.tiles[new_room.outer]] != tileids[floor_tile],
+                tileids[dungeon.tiles[new_room.outer]] != tileids[tunnel_tile]
                 )] = wall_tile
 
         if i == 0:
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import contextlib
+from collections import deque
+import time
+from typing import Deque, Dict, Iterator, List, Tuple
+
+
+# The phases of a turn and the frame after it, in the order they happen.
+PHASES = ("perform", "ai", "fov", "render", "present")
+
+
+class PhaseTimer:
+    """
+    Keeps the wall time of the last `size` runs of each phase of a turn in ring buffers, to tell
+    which one is responsible when the game feels sluggish.
+    """
+
+    def __init__(self, size: int = 120):
+        self.size = size
+        self.samples: Dict[str, Deque[float]] = {}
+        self.show_overlay = False
+
+    @contextlib.contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Time the body of the with statement as a run of `phase`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def record(self, phase: str, seconds: float) -> None:
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.size)
+        samples.append(seconds)
+
+    def get_stats(self, phase: str) -> Tuple[float, float, float]:
+        """Return the (median, 95th percentile, maximum) time of the recorded runs of `phase`, in seconds."""
+        samples = sorted(self.samples.get(phase, ()))
+        if not samples:
+            return 0.0, 0.0, 0.0
+        last = len(samples) - 1
+        return samples[last // 2], samples[round(last * 0.95)], samples[last]
+
+    def get_report(self) -> List[Tuple[str, float, float, float]]:
+        """Return (phase, p50, p95, max) for each phase with recorded runs, in the order they happen."""
+        phases = [phase for phase in PHASES if phase in self.samples]
+        phases += [phase for phase in self.samples if phase not in PHASES]
+        return [(phase, *self.get_stats(phase)) for phase in phases]
+
+    def toggle_overlay(self) -> None:
+        self.show_overlay = not self.show_overlay
+
+    def clear(self) -> None:
+        self.samples.clear()
+
+
+timer = PhaseTimer()
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from typing import Tuple, TYPE_CHECKING
+from typing import List, Tuple, TYPE_CHECKING
 import math
+import weakref
 
 import color
 
@@ -9,9 +10,10 @@ if TYPE_CHECKING:
     from tcod import Console
     from engine import Engine
     from game_map import GameMap
+    from profiling import PhaseTimer
 
 
-def get_names_at_location(x: int, y: int, game_map: GameMap) -> str:
+def get_names_at_location(x: int, y: int, game_map: GameMap) -> List[str]:
     if not game_map.in_bounds(x, y):
         return [""]
 
@@ -23,17 +25,33 @@ def get_names_at_location(x: int, y: int, game_map: GameMap) -> str:
 
     def func(en):
         return en.value
-    entities = sorted([entity for entity in game_map.entities if entity.x == x and entity.y == y], key=func, reverse=True)
+    entities = sorted(game_map.entities_at.get((x, y), ()), key=func, reverse=True)
     names = [en.name for en in entities]
 
     return names
-def render_names_at_mouse_location(
-    console: Console, x: int, y: int, engine: Engine
-) -> None:
+
+
+def get_mouse_tooltip(engine: Engine) -> str:
+    """
+    Return the distance to and the names of what is under the mouse.
+
+    Nothing on the map changes between turns, so the text is only computed again when the mouse
+    moves to another tile, a turn passes, or the map or its entities change.  The last one is kept in
+    `engine.tooltip_cache`, with a weak reference to its map: unlike an id, that can't come to mean
+    another map once the first is gone.
+    """
+    game_map = engine.game_map
     mouse_x, mouse_y = engine.mouse_location
+    key = (
+        mouse_x, mouse_y, engine.player.x, engine.player.y, engine.turn_count,
+        game_map.entities_version, game_map.tiles_version,
+    )
+    cached_map, cached_key, tooltip = engine.tooltip_cache
+    if cached_map is not None and cached_map() is game_map and key == cached_key:
+        return tooltip
 
     names_at_mouse_location = get_names_at_location(
-        x=mouse_x, y=mouse_y, game_map=engine.game_map
+        x=mouse_x, y=mouse_y, game_map=game_map
     )
     ln = len(names_at_mouse_location)
     if ln > 0:
@@ -43,7 +61,15 @@ def render_names_at_mouse_location(
         name = _and = ""
 
     d = round(math.sqrt((mouse_x-engine.player.x)**2 + (mouse_y-engine.player.y)**2))
-    console.print(x=x, y=y, string=f"{d}m: {name}{_and}")
+    tooltip = f"{d}m: {name}{_and}"
+    engine.tooltip_cache = weakref.ref(game_map), key, tooltip
+    return tooltip
+
+
+def render_names_at_mouse_location(
+    console: Console, x: int, y: int, engine: Engine
+) -> None:
+    console.print(x=x, y=y, string=get_mouse_tooltip(engine))
 
 
 def render_bar(
@@ -73,3 +99,22 @@ def render_dungeon_level(
 
     console.print(x=x, y=y, string=f"Dungeon level: {dungeon_level}")
 
+
+
+def render_phase_timings(
+    console: Console, timer: PhaseTimer, location: Tuple[int, int]
+) -> None:
+    """
+    Render the median, 95th percentile and maximum time of each phase of a turn, in milliseconds.
+    """
+    x, y = location
+
+    console.print(x=x, y=y, string="phase      p50    p95    max", fg=color.accent, bg=color.black)
+    for i, (phase, p50, p95, worst) in enumerate(timer.get_report(), start=1):
+        console.print(
+            x=x,
+            y=y + i,
+            string=f"{phase:<8}{p50 * 1000:6.1f} {p95 * 1000:6.1f} {worst * 1000:6.1f}",
+            fg=color.offwhite,
+            bg=color.black,
+        )
@@ -2,11 +2,13 @@
 from __future__ import annotations
 
 import copy
+import functools
 import lzma
 import pickle
 import traceback
 from typing import Optional
 
+import numpy as np  # type: ignore
 import tcod
 from tcod import libtcodpy
 
@@ -18,18 +20,31 @@ import input_handlers
 from const import *
 
 
-# Load the background image and remove the alpha channel.
-background_image = tcod.image.load("../img/softly-main-menu.png")[:, :, :3]
+# Worker processes generating the next zones ahead in a game played from the main menu, 0 for none.
+# Not saved with the game, it's set again whenever one is started or loaded.
+PREGEN_WORKERS = 1
 
 
-def new_game() -> Engine:
-    """Return a brand new game session as an Engine instance."""
+@functools.lru_cache(maxsize=None)
+def get_background_image() -> np.ndarray:
+    """Load the background image and remove the alpha channel.
+
+    It's only loaded once the main menu is first drawn, so headless runs never touch it.
+    """
+    return tcod.image.load("../img/softly-main-menu.png")[:, :, :3]
+
+
+def new_game(seed: Optional[int] = None) -> Engine:
+    """Return a brand new game session as an Engine instance.
+
+    Games started with the same `seed` are generated the same way.
+    """
     map_width = 80
     map_height = 41
 
     player = copy.deepcopy(entity_factories.player)
 
-    engine = Engine(player=player)
+    engine = Engine(player=player, seed=seed)
 
     engine.game_world = GameWorld(
         engine=engine,
@@ -77,12 +92,19 @@ def load_game(filename: str) -> Engine:
     return engine
 
 
+def start_game(engine: Engine) -> input_handlers.MainGameEventHandler:
+    """Play a new or loaded game, generating its next zones ahead with PREGEN_WORKERS processes."""
+    engine.pregenerator.workers = PREGEN_WORKERS
+    engine.pregenerator.schedule(engine)
+    return input_handlers.MainGameEventHandler(engine)
+
+
 class MainMenu(input_handlers.BaseEventHandler):
     """Handle the main menu rendering and input."""
 
     def on_render(self, console: tcod.Console) -> None:
         """Render the main menu on a background image."""
-        console.draw_semigraphics(background_image, 0, 0)
+        console.draw_semigraphics(get_background_image(), 0, 0)
 
         xs = console.width // 2
         ys = console.height // 2
@@ -123,13 +145,13 @@ class MainMenu(input_handlers.BaseEventHandler):
             raise SystemExit()
         elif event.sym == tcod.event.KeySym.c:
             try:
-                return input_handlers.MainGameEventHandler(load_game("../sav/game.sav"))
+                return start_game(load_game("../sav/game.sav"))
             except FileNotFoundError:
                 return input_handlers.PopupMessage(self, "No saved game to load.")
             except Exception as exc:
                 traceback.print_exc()  # Print to stderr.
                 return input_handlers.PopupMessage(self, f"Failed to load save:\n{exc}")
         elif event.sym == tcod.event.KeySym.n:
-            return input_handlers.MainGameEventHandler(new_game())
+            return start_game(new_game())
 
         return None
@@ -0,0 +1,21 @@
+import os
+import sys
+
+# The game's modules are imported from src/, as when running it.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import entity_factories
+import setup_game
+
+entity_factories.initialize_all_weapons()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A new game on the first floor, saving its zones under tmp_path."""
+    engine = setup_game.new_game(seed=3)
+    engine.save_dir = str(tmp_path)
+    yield engine
+    engine.zone_writer.close()  # Before tmp_path goes away.
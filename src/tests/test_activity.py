@@ -0,0 +1,19 @@
+import copy
+
+import entity_factories
+
+
+def test_items_coming_and_going_dont_rescan_actors(engine):
+    game_map = engine.game_map
+    activity = engine.activity
+    x, y = engine.player.x, engine.player.y
+    activity.get_actors_to_schedule(engine)
+
+    potion = copy.deepcopy(entity_factories.health_potion)
+    potion.place(x, y, game_map)
+    game_map.remove_entity(potion)
+    assert activity.actors_version == game_map.actors_version
+
+    monster = entity_factories.omnibot.spawn(game_map, x, y)
+    assert activity.get_actors_to_schedule(engine) == [monster]
+    assert activity.get_actors_to_schedule(engine) == []
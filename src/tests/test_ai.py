@@ -0,0 +1,70 @@
+import numpy as np
+
+from components import ai
+from components.ai import HostileEnemy, PATH_RETARGET_DISTANCE
+import entity_factories
+
+
+def open_tiles(game_map):
+    return [
+        (int(x), int(y))
+        for x, y in zip(*np.nonzero(game_map.walkable))
+        if not game_map.get_blocking_entity_at_location(x, y)
+    ]
+
+
+def spawn_far_from_player(engine):
+    game_map = engine.game_map
+    player = engine.player
+    x, y = max(open_tiles(game_map), key=lambda t: abs(t[0] - player.x) + abs(t[1] - player.y))
+    return entity_factories.omnibot.spawn(game_map, x, y)
+
+
+def reset_stats():
+    for key in ai.path_cache_stats:
+        ai.path_cache_stats[key] = 0
+
+
+def test_cached_path_is_reused_until_invalid(engine):
+    monster = spawn_far_from_player(engine)
+    target = engine.player.x, engine.player.y
+    reset_stats()
+
+    path = monster.ai.get_cached_path_to(*target)
+    assert path and path[-1] == target
+    assert ai.path_cache_stats == {"hits": 0, "misses": 1}
+
+    # Following the path keeps it valid.
+    monster.move_to(*path.popleft())
+    assert monster.ai.get_cached_path_to(*target) is path
+    assert ai.path_cache_stats == {"hits": 1, "misses": 1}
+
+    # A target which moved a little keeps the path, further away it's computed again.
+    monster.ai.get_cached_path_to(target[0] + PATH_RETARGET_DISTANCE, target[1])
+    assert ai.path_cache_stats["misses"] == 1
+    monster.ai.path_target = (target[0] + PATH_RETARGET_DISTANCE + 1, target[1])
+    monster.ai.get_cached_path_to(*target)
+    assert ai.path_cache_stats["misses"] == 2
+
+
+def test_cached_path_is_recomputed_when_blocked(engine):
+    monster = spawn_far_from_player(engine)
+    target = engine.player.x, engine.player.y
+    path = monster.ai.get_cached_path_to(*target)
+    blocker = entity_factories.omnibot.spawn(engine.game_map, *path[0])
+    reset_stats()
+
+    new_path = monster.ai.get_cached_path_to(*target)
+    assert ai.path_cache_stats == {"hits": 0, "misses": 1}
+    assert (blocker.x, blocker.y) not in new_path
+
+
+def test_chasing_by_flow_field_forgets_the_cached_path(engine):
+    monster = spawn_far_from_player(engine)
+    monster.ai.get_cached_path_to(engine.player.x, engine.player.y)
+    assert monster.ai.path
+    engine.game_map.visible[monster.x, monster.y] = True  # In sight, so it chases by the flow field.
+
+    assert type(monster.ai) is HostileEnemy
+    monster.ai.perform()
+    assert not monster.ai.path and monster.ai.path_target is None
@@ -0,0 +1,98 @@
+import random
+
+from components.ai import perform_chase_batch
+import entity_factories
+import exceptions
+from game_map import GameMap
+import tile_types
+
+SIDE = 30
+
+
+def make_arena(engine, positions):
+    """An open walled room with the player in the middle and an omnibot at each of `positions`."""
+    game_map = GameMap(engine, SIDE, SIDE, default_fill=tile_types.concrete_floor)
+    game_map.tiles[[0, -1], :] = tile_types.concrete_wall
+    game_map.tiles[:, [0, -1]] = tile_types.concrete_wall
+    game_map.tiles_version += 1
+    engine.game_map = game_map
+    engine.player.place(SIDE // 2, SIDE // 2, game_map)
+    engine.update_fov()
+    return [entity_factories.omnibot.spawn(game_map, x, y) for x, y in positions]
+
+
+def move_one_by_one(engine, actors):
+    """What one MovementAction per actor would do, in the same order."""
+    for actor in actors:
+        try:
+            actor.ai.perform()
+        except exceptions.Impossible:
+            pass
+
+
+def compare(engine, actors):
+    """Return the positions after a batch move and after moving one by one from the same start."""
+    start = [(actor.x, actor.y) for actor in actors]
+    assert perform_chase_batch(engine, actors) == []
+    batched = [(actor.x, actor.y) for actor in actors]
+    for actor, (x, y) in zip(actors, start):
+        actor.move_to(x, y)
+    move_one_by_one(engine, actors)
+    return batched, [(actor.x, actor.y) for actor in actors]
+
+
+def test_batch_moves_like_one_movement_action_each(engine):
+    # Spread out, nobody gets in anyone's way.
+    starts = [(3, 3), (3, 26), (26, 3), (26, 26), (15, 4), (4, 15)]
+    actors = make_arena(engine, starts)
+    batched, one_by_one = compare(engine, actors)
+    assert batched == one_by_one
+    assert all(position != start for position, start in zip(batched, starts))
+
+
+def test_contested_tile_goes_to_the_first_actor(engine):
+    actors = make_arena(engine, [(14, 10), (16, 10)])
+    # A wall between them and the player, with one gap both of them head for.
+    game_map = engine.game_map
+    game_map.tiles[1:-1, 11] = tile_types.concrete_wall
+    game_map.tiles[15, 11] = tile_types.concrete_floor
+    game_map.tiles_version += 1
+    engine.update_fov()
+    for actor in actors:
+        game_map.visible[actor.x, actor.y] = True  # Seen through the gap.
+    flow_field = game_map.get_flow_field_to(SIDE // 2, SIDE // 2)
+    assert flow_field.get_step(14, 10) == flow_field.get_step(16, 10) == (15, 11)
+
+    batched, one_by_one = compare(engine, actors)
+    assert batched == one_by_one == [(15, 11), (16, 10)]
+
+
+def test_a_crowd_never_overlaps_or_walks_into_walls(engine):
+    rng = random.Random(5)
+    tiles = [(x, y) for x in range(1, SIDE - 1) for y in range(1, SIDE - 1) if (x, y) != (SIDE // 2, SIDE // 2)]
+    actors = make_arena(engine, rng.sample(tiles, 300))
+    flow_field = engine.game_map.get_flow_field_to(SIDE // 2, SIDE // 2)
+    start = [(actor.x, actor.y) for actor in actors]
+    steps = [flow_field.get_step(x, y) for x, y in start]
+
+    perform_chase_batch(engine, actors)
+    positions = [(actor.x, actor.y) for actor in actors]
+    assert len(set(positions)) == len(positions)
+    assert (SIDE // 2, SIDE // 2) not in positions
+    assert all(engine.game_map.walkable[x, y] for x, y in positions)
+    # Each actor either stayed or took the step the flow field gave it.
+    assert all(position in (old, step) for position, old, step in zip(positions, start, steps))
+    assert positions != start
+
+
+def test_a_line_of_monsters_moves_up_together(engine):
+    # In a corridor the one behind comes first, one by one it would bump into the one ahead.
+    actors = make_arena(engine, [(15, 10), (15, 11)])
+    game_map = engine.game_map
+    game_map.tiles[1:-1, 5:14] = tile_types.concrete_wall
+    game_map.tiles[15, 5:14] = tile_types.concrete_floor
+    game_map.tiles_version += 1
+    engine.update_fov()
+    batched, one_by_one = compare(engine, actors)
+    assert batched == [(15, 11), (15, 12)]
+    assert one_by_one == [(15, 10), (15, 12)]
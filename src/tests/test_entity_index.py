@@ -0,0 +1,44 @@
+import pickle
+import random
+
+import entity_factories
+
+
+def scan(game_map, x, y):
+    """The entities at x, y as the map found them before it had an index: by looking at every one."""
+    return {entity for entity in game_map.entities if entity.x == x and entity.y == y}
+
+
+def assert_index_matches_scan(game_map):
+    for x, y in {(entity.x, entity.y) for entity in game_map.entities} | {(0, 0), (1, 1)}:
+        found = scan(game_map, x, y)
+        assert set(game_map.get_entities_at_location(x, y)) == found
+        assert set(game_map.get_items_at_location(x, y)) == {e for e in found if e in set(game_map.items)}
+        blocking = game_map.get_blocking_entity_at_location(x, y)
+        assert blocking in found if blocking else not any(e.blocks_movement for e in found)
+        actor = game_map.get_actor_at_location(x, y)
+        assert actor in found and actor.is_alive if actor else not any(e in set(game_map.actors) for e in found)
+    assert sum(len(cell) for cell in game_map.entities_at.values()) == len(game_map.entities)
+
+
+def test_index_follows_moves_spawns_deaths_and_removals(engine):
+    game_map = engine.game_map
+    rng = random.Random(5)
+    floor = [(x, y) for x in range(game_map.width) for y in range(game_map.height) if game_map.walkable[x, y]]
+    monsters = [entity_factories.omnibot.spawn(game_map, *rng.choice(floor)) for _ in range(20)]
+    assert_index_matches_scan(game_map)
+
+    for monster in monsters[:10]:
+        monster.move_to(*rng.choice(floor))
+    for monster in monsters[10:15]:
+        monster.fighter.die()
+    for monster in monsters[15:]:
+        game_map.remove_entity(monster)
+    engine.player.place(*rng.choice(floor))
+    assert_index_matches_scan(game_map)
+
+
+def test_index_is_rebuilt_after_loading(engine):
+    game_map = pickle.loads(pickle.dumps(engine.game_map))
+    assert game_map._entities_at is None
+    assert_index_matches_scan(game_map)
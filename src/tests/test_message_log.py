@@ -0,0 +1,115 @@
+import itertools
+import pickle
+
+import tcod
+
+import input_handlers
+from message_log import ARCHIVE_BLOCK_SIZE, Message, MessageArchive, MessageLog
+
+
+def wrap_all(log, width):
+    """The lines of the whole log wrapped from scratch, oldest first."""
+    return [line for message in log.messages for line in MessageLog.wrap(message.full_text, width)]
+
+
+def test_wrapped_lines_are_cached_until_the_count_changes():
+    message = Message("the quick brown fox jumps over the lazy dog", (255, 255, 255))
+    lines = message.get_lines(10)
+    assert message.get_lines(10) is lines
+    assert message.get_lines(20) is not lines
+
+    message.count = 2
+    assert message.get_lines(10) is not lines
+    assert message.get_lines(10)[-1].endswith("(x2)")
+
+
+def test_line_index_follows_added_and_stacked_messages():
+    log = MessageLog()
+    for i in range(50):
+        log.add_message(f"message number {i} " + "word " * (i % 7))
+        if i % 5 == 0:
+            log.add_message(f"message number {i} " + "word " * (i % 7))  # Stacks as (x2).
+        assert log.line_count(12) == len(wrap_all(log, 12))
+    ends = log.get_line_ends(12)
+    assert ends == sorted(ends) and len(ends) == len(log.messages)
+
+
+def test_render_lines_shows_the_lines_up_to_the_cursor():
+    log = MessageLog()
+    for i in range(30):
+        log.add_message(f"line {i:02} with some words to wrap")
+    width, height = 12, 5
+    lines = wrap_all(log, width)
+    console = tcod.console.Console(width, height, order="F")
+    for last_line in (height - 1, 37, len(lines) - 1):
+        console.clear()
+        log.render_lines(console, 0, 0, width, height, last_line)
+        shown = ["".join(chr(c) for c in console.ch[:, y]).rstrip() for y in range(height)]
+        assert shown == lines[last_line - height + 1 : last_line + 1]
+
+
+def fill(log, count, prefix="message"):
+    for i in range(count):
+        log.add_message(f"{prefix} {i}")
+
+
+def test_old_messages_are_archived_in_blocks_and_read_back(tmp_path):
+    log = MessageLog(max_messages=10)
+    log.archive = MessageArchive(str(tmp_path))
+    fill(log, 11 + 3 * ARCHIVE_BLOCK_SIZE)  # Archived once the log is a block over.
+
+    assert len(log.archive) == 3
+    assert len(log.messages) == 11
+    for index in range(3):
+        block = log.archive.read_block(index)
+        assert [m.plain_text for m in block] == [
+            f"message {i}" for i in range(index * ARCHIVE_BLOCK_SIZE, (index + 1) * ARCHIVE_BLOCK_SIZE)
+        ]
+
+
+def test_games_sharing_a_save_directory_keep_their_own_archives(tmp_path):
+    saved = MessageLog(max_messages=10)
+    saved.archive = MessageArchive(str(tmp_path))
+    fill(saved, 11 + ARCHIVE_BLOCK_SIZE, "saved")
+    saved_archive = pickle.loads(pickle.dumps(saved.archive))  # As the saved game has it.
+
+    new = MessageLog(max_messages=10)
+    new.archive = MessageArchive(str(tmp_path))
+    fill(new, 11 + ARCHIVE_BLOCK_SIZE, "new")
+
+    assert new.archive.path != saved_archive.path
+    assert saved_archive.read_block(0)[0].plain_text == "saved 0"
+
+
+def test_prepending_shifts_the_line_index_without_rewrapping():
+    log = MessageLog()
+    fill(log, 40)
+    log.get_line_ends(8)
+    older = [Message(f"older message {i}", (255, 255, 255)) for i in range(5)]
+    wrapped = []
+    for message in log.messages:
+        message.get_lines = lambda width, message=message: wrapped.append(message) or Message.get_lines(message, width)
+
+    log.prepend(older)
+    line_ends = log.get_line_ends(8)
+    assert not wrapped  # Only the prepended messages were wrapped.
+    assert line_ends == list(itertools.accumulate(
+        len(list(MessageLog.wrap(message.full_text, 8))) for message in log.messages
+    ))
+
+
+def test_history_viewer_pages_in_the_archive_keeping_the_cursor_on_its_line(engine):
+    engine.message_log = MessageLog(max_messages=10)
+    engine.save_dir = engine.save_dir  # Gives the new log an archive.
+    fill(engine.message_log, 11 + 2 * ARCHIVE_BLOCK_SIZE)
+    viewer = input_handlers.HistoryViewer(engine)
+    viewer.width = 30
+    viewer.log_length = viewer.history.line_count(viewer.width)
+    viewer.cursor = 0
+    first = viewer.history.messages[0]
+
+    assert viewer.load_older_messages()
+    assert viewer.history.messages[viewer.cursor] is first  # One line per message here.
+    assert viewer.load_older_messages()
+    assert not viewer.load_older_messages()
+    assert [m.plain_text for m in viewer.history.messages] == [f"message {i}" for i in range(11 + 2 * ARCHIVE_BLOCK_SIZE)]
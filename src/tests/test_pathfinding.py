@@ -0,0 +1,82 @@
+import numpy as np
+
+import entity_factories
+import pathfinding
+import tile_types
+
+
+def path_cost(game_map, start, path):
+    """What following a path costs in the flow field's terms: each step is paid for by the tile it leaves."""
+    cost = pathfinding.get_cost_array(game_map)
+    total = 0
+    x, y = start
+    for nx, ny in path:
+        diagonal = nx != x and ny != y
+        total += (pathfinding.DIAGONAL_COST if diagonal else pathfinding.CARDINAL_COST) * int(cost[x, y])
+        x, y = nx, ny
+    return total
+
+
+def follow(flow_field, x, y):
+    path = []
+    while (step := flow_field.get_step(x, y)) is not None:
+        path.append(step)
+        x, y = step
+    return path
+
+
+def test_flow_field_steps_follow_a_shortest_path(engine):
+    game_map = engine.game_map
+    target = engine.player.x, engine.player.y
+    flow_field = pathfinding.FlowField(game_map, *target)
+    monster = entity_factories.omnibot.spawn(game_map, *target)  # Moved around to ask the pathfinder.
+    game_map.remove_entity(monster)
+    for x, y in list(zip(*np.nonzero(game_map.walkable)))[::37]:
+        start = int(x), int(y)
+        path = follow(flow_field, *start)
+        if not path:
+            continue
+        assert path[-1] == target
+        # Nothing shorter than the distance map, and the steps add up to it.
+        assert path_cost(game_map, start, path) == flow_field.distance[start]
+        monster.x, monster.y = start
+        reference = monster.ai.get_path_to(*target)
+        assert path_cost(game_map, start, reference) >= flow_field.distance[start]
+
+
+def test_get_steps_matches_get_step(engine):
+    game_map = engine.game_map
+    xs, ys = np.nonzero(game_map.walkable)
+    flow_field = game_map.get_flow_field_to(engine.player.x, engine.player.y)
+    step_x, step_y, has_step = flow_field.get_steps(xs, ys)
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        step = flow_field.get_step(x, y)
+        assert has_step[i] == (step is not None)
+        if step is not None:
+            assert (step_x[i], step_y[i]) == step
+
+
+def test_flow_field_is_shared_until_the_turn_or_tiles_change(engine):
+    game_map = engine.game_map
+    x, y = engine.player.x, engine.player.y
+    flow_field = game_map.get_flow_field_to(x, y)
+    assert game_map.get_flow_field_to(x, y) is flow_field
+
+    engine.turn_count += 1
+    assert game_map.get_flow_field_to(x, y) is not flow_field
+
+    flow_field = game_map.get_flow_field_to(x, y)
+    game_map.set_tile(x + 1, y, tile_types.concrete_wall)
+    assert game_map.get_flow_field_to(x, y) is not flow_field
+
+
+def test_standing_on_a_tile_doesnt_change_the_step_from_it(engine):
+    game_map = engine.game_map
+    target = engine.player.x, engine.player.y
+    flow_field = pathfinding.FlowField(game_map, *target)
+    for x, y in list(zip(*np.nonzero(game_map.walkable)))[::53]:
+        if game_map.get_blocking_entity_at_location(x, y):
+            continue
+        monster = entity_factories.omnibot.spawn(game_map, int(x), int(y))
+        assert pathfinding.FlowField(game_map, *target).get_step(x, y) == flow_field.get_step(x, y)
+        game_map.remove_entity(monster)
@@ -0,0 +1,60 @@
+from concurrent.futures import Future
+import random
+
+import pregen
+import setup_game
+
+
+def new_engine(save_dir):
+    engine = setup_game.new_game(seed=11)
+    engine.save_dir = str(save_dir)
+    engine.player.place(*engine.game_map.downstairs_location)
+    return engine
+
+
+def get_state(engine):
+    game_map = engine.game_map
+    return (
+        game_map.tiles.tolist(),
+        game_map.downstairs_location,
+        sorted((entity.name, entity.x, entity.y) for entity in game_map.entities),
+        [fingerprint for _, fingerprint in game_map.generated_entities],
+        (engine.player.x, engine.player.y),
+        dict(engine.explored_zones),
+        random.getstate(),
+    )
+
+
+def generate_ahead(engine, x, y):
+    """Generate the floor below as a worker would, but in this process."""
+    key = engine.pregenerator.get_key(engine, (40, 1), x, y, -1)
+    state = random.getstate()
+    result = pregen._generate(engine.game_world.map_width, engine.game_world.map_height, key)
+    random.setstate(state)
+    future = Future()
+    future.set_result(result)
+    engine.pregenerator.futures[key] = future
+
+
+def test_adopted_zone_matches_generating_it_on_the_spot(tmp_path, capsys):
+    engine = new_engine(tmp_path / "inline")
+    engine.descend()
+    expected = get_state(engine)
+    engine.zone_writer.close()
+
+    engine = new_engine(tmp_path / "ahead")
+    generate_ahead(engine, engine.player.x, engine.player.y)
+    engine.descend()
+    assert "using zone generated ahead" in capsys.readouterr().out
+    assert get_state(engine) == expected
+    assert engine.player.parent is engine.game_map
+    engine.zone_writer.close()
+
+
+def test_zone_generated_for_another_arrival_is_not_adopted(tmp_path, capsys):
+    engine = new_engine(tmp_path)
+    generate_ahead(engine, engine.player.x + 1, engine.player.y)
+    engine.descend()
+    assert "using zone generated ahead" not in capsys.readouterr().out
+    assert len(engine.pregenerator.futures) == 1  # Still waiting for an arrival which won't come.
+    engine.zone_writer.close()
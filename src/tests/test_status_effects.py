@@ -0,0 +1,61 @@
+from components.ai import ConfusedEnemy, HostileEnemy
+from components.status_effects import Confused, StatBuff
+import entity_factories
+from turn_scheduler import TURN_LENGTH
+
+
+def spawn_monster(engine):
+    return entity_factories.omnibot.spawn(engine.game_map, engine.player.x, engine.player.y)
+
+
+def messages(engine):
+    return [message.plain_text for message in engine.message_log.messages]
+
+
+def test_confusion_wears_off_after_its_duration(engine):
+    monster = spawn_monster(engine)
+    monster.fighter.apply_status_effect(Confused(3))
+    assert isinstance(monster.ai, ConfusedEnemy)
+
+    engine.status_effects.process_due(engine, engine.scheduler.time + 3 * TURN_LENGTH - 1)
+    assert isinstance(monster.ai, ConfusedEnemy)
+    engine.status_effects.process_due(engine, engine.scheduler.time + 3 * TURN_LENGTH)
+    assert type(monster.ai) is HostileEnemy
+    assert not monster.fighter.status_effects
+    assert messages(engine)[-1] == f"The {monster.name} is no longer confused."
+
+
+def test_reapplying_an_effect_extends_it(engine):
+    monster = spawn_monster(engine)
+    monster.fighter.apply_status_effect(Confused(3))
+    monster.fighter.apply_status_effect(Confused(5))
+    assert len(engine.status_effects) == 1
+
+    engine.status_effects.process_due(engine, engine.scheduler.time + 4 * TURN_LENGTH)
+    assert isinstance(monster.ai, ConfusedEnemy)
+    engine.status_effects.process_due(engine, engine.scheduler.time + 5 * TURN_LENGTH)
+    assert type(monster.ai) is HostileEnemy
+
+
+def test_stat_bonuses_last_as_long_as_the_effect(engine):
+    fighter = engine.player.fighter
+    speed = fighter.speed
+    fighter.apply_status_effect(StatBuff("haste", 2, {"speed": 50}))
+    assert fighter.speed == speed + 50
+
+    engine.status_effects.process_due(engine, engine.scheduler.time + 2 * TURN_LENGTH)
+    assert fighter.speed == speed
+    assert len(engine.status_effects) == 0
+
+
+def test_leaving_a_zone_ends_its_effects_quietly(engine):
+    monster = spawn_monster(engine)
+    monster.fighter.apply_status_effect(Confused(50))
+    engine.player.fighter.apply_status_effect(StatBuff("haste", 50, {"speed": 50}))
+    before = messages(engine)
+
+    engine.status_effects.settle(engine, engine.game_map)
+    assert type(monster.ai) is HostileEnemy
+    assert "haste" in engine.player.fighter.status_effects
+    assert [effect.target for _, _, effect in engine.status_effects.queue] == [engine.player]
+    assert messages(engine) == before
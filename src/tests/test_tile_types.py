@@ -0,0 +1,49 @@
+import numpy as np
+import tcod
+
+import tile_types
+
+
+def test_property_tables_match_the_tile_definitions(engine):
+    game_map = engine.game_map
+    assert game_map.tiles.dtype == tile_types.tile_id_dt
+    records = np.array([tile_types.registry[tile] for tile in game_map.tiles.flat], dtype=tile_types.tile_dt)
+    records = records.reshape(game_map.tiles.shape)
+
+    for name in ("walkable", "transparent", "not_obscuring", "fall_through"):
+        array = getattr(game_map, name)
+        assert array.flags.c_contiguous
+        np.testing.assert_array_equal(array, records[name])
+
+
+def test_set_tile_invalidates_the_cached_properties(engine):
+    game_map = engine.game_map
+    x, y = engine.player.x + 1, engine.player.y
+    walkable = game_map.walkable
+    assert game_map.walkable is walkable  # Cached between calls.
+
+    game_map.set_tile(x, y, tile_types.concrete_wall)
+    assert game_map.walkable is not walkable
+    assert not game_map.walkable[x, y]
+    assert not game_map.transparent[x, y]
+
+
+def test_render_matches_drawing_from_the_tile_definitions(engine):
+    game_map = engine.game_map
+    console = tcod.console.Console(game_map.width, game_map.height, order="F")
+    game_map.render(console)
+
+    # As the map was drawn when it held a tile_dt record for every cell.
+    memory = tile_types.get_tile_table()[game_map.tiles_memory]
+    expected = np.select(
+        condlist=[game_map.lit_and_visible, game_map.visible, game_map.obscured_but_visible, game_map.explored],
+        choicelist=[memory["light"], memory["dark"], memory["obscured"], memory["deep"]],
+        default=tile_types.SHROUD,
+    )
+    entities = {(entity.x, entity.y) for entity in game_map.entities}
+    drawn = np.ones(game_map.tiles.shape, dtype=bool)
+    for x, y in entities:
+        drawn[x, y] = False
+    np.testing.assert_array_equal(console.ch[drawn], expected["ch"][drawn])
+    np.testing.assert_array_equal(console.fg[drawn], expected["fg"][drawn])
+    np.testing.assert_array_equal(console.bg[drawn], expected["bg"][drawn])
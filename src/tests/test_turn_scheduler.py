@@ -0,0 +1,96 @@
+import copy
+
+import pytest
+
+from components.status_effects import DamageOverTime
+import entity_factories
+import exceptions
+from actions import RestAction
+from turn_scheduler import get_action_delay, TURN_LENGTH, TurnScheduler
+
+
+def make_actor(speed):
+    actor = copy.deepcopy(entity_factories.omnibot)
+    actor.fighter.base_speed = speed
+    return actor
+
+
+def test_faster_actors_act_more_often():
+    scheduler = TurnScheduler()
+    slow, normal, fast = make_actor(50), make_actor(100), make_actor(200)
+    for actor in (slow, normal, fast):
+        scheduler.schedule(actor, 0)
+
+    acted = []
+    for time, actors in scheduler.pop_due_batches(4 * TURN_LENGTH):
+        for actor in actors:
+            acted.append(actor)
+            scheduler.schedule(actor, time + get_action_delay(actor))
+    assert (acted.count(slow), acted.count(normal), acted.count(fast)) == (2, 4, 8)
+    assert scheduler.time == 7 * TURN_LENGTH // 2  # The fast actor's last turn.
+
+
+def test_actors_due_together_act_in_the_order_they_were_scheduled():
+    scheduler = TurnScheduler()
+    first, second = make_actor(100), make_actor(100)
+    scheduler.schedule(first, 10)
+    scheduler.schedule(second, 10)
+    assert list(scheduler.pop_due_batches(11)) == [(10, [first, second])]
+
+
+def test_rescheduling_replaces_the_earlier_entry():
+    scheduler = TurnScheduler()
+    actor = make_actor(100)
+    scheduler.schedule(actor, 5)
+    scheduler.schedule(actor, 50)
+    assert scheduler.next_time == 50
+    assert list(scheduler.pop_due_batches(100)) == [(50, [actor])]
+    assert scheduler.next_time is None
+
+
+def remove_other_actors(engine):
+    for actor in list(engine.game_map.actors):
+        if actor is not engine.player:
+            engine.game_map.remove_entity(actor)
+
+
+def test_fast_forward_jumps_over_idle_turns(engine):
+    remove_other_actors(engine)
+    start_time, start_turn = engine.scheduler.time, engine.turn_count
+
+    assert engine.fast_forward(1000) == 1000
+    assert engine.turn_count == start_turn + 1000
+    assert engine.scheduler.time == start_time + 1000 * get_action_delay(engine.player)
+
+
+def test_fast_forward_stops_when_the_player_is_hurt(engine):
+    remove_other_actors(engine)
+    engine.player.fighter.apply_status_effect(DamageOverTime("bleeding", 30, damage=1, tick_interval=10))
+    hp = engine.player.fighter.hp
+    start_time = engine.scheduler.time
+
+    passed = engine.fast_forward(100)
+    assert engine.player.fighter.hp == hp - 1
+    # Stopped on the turn of the first tick, 10 turns in.
+    assert engine.scheduler.time - start_time == passed * get_action_delay(engine.player)
+    assert (passed - 1) * get_action_delay(engine.player) <= 10 * TURN_LENGTH < passed * get_action_delay(engine.player)
+
+
+def test_fast_forward_stops_when_something_comes_into_view(engine):
+    remove_other_actors(engine)
+    engine.update_fov()
+    visible = engine.game_map.visible
+    x, y = next(
+        (x, y)
+        for x in range(engine.game_map.width)
+        for y in range(engine.game_map.height)
+        if engine.game_map.walkable[x, y] and not visible[x, y]
+        and max(abs(x - engine.player.x), abs(y - engine.player.y)) <= 12
+    )
+    monster = entity_factories.omnibot.spawn(engine.game_map, x, y)
+    monster.ai.last_seen = engine.player.x, engine.player.y  # It heads for the player.
+
+    assert engine.fast_forward(500) < 500
+    assert engine.is_actor_in_view()
+    with pytest.raises(exceptions.Impossible):
+        RestAction(engine.player, True, 10).perform()
@@ -0,0 +1,71 @@
+import numpy as np
+from tcod.map import compute_fov
+
+import entity_factories
+import tile_types
+
+
+def disk_fov(transparency, x, y, radius):
+    """The field of view as update_fov computed it before it was made incremental: over the whole map."""
+    fov = compute_fov(transparency, (x, y), radius=radius)
+    cx, cy = np.indices(transparency.shape)
+    return fov & ((cx - x) ** 2 + (cy - y) ** 2 <= radius * radius)
+
+
+def assert_view_matches_full_recompute(engine):
+    game_map = engine.game_map
+    player = engine.player
+    lgt_bonus = 10 if engine.world_location[1] == 0 else 0
+    rad = int(min(max(player.fighter.vision * 0.1, (player.fighter.light + lgt_bonus) * 2), player.fighter.vision))
+    visible = disk_fov(game_map.transparent, player.x, player.y, rad)
+    obscured = disk_fov(game_map.not_obscuring, player.x, player.y, rad) & ~visible
+    lit = np.zeros_like(visible)
+    for actor in game_map.actors:
+        if actor.fighter.light > 0:
+            lit |= disk_fov(game_map.transparent, actor.x, actor.y, actor.fighter.light + lgt_bonus)
+
+    np.testing.assert_array_equal(game_map.visible, visible)
+    np.testing.assert_array_equal(game_map.obscured_but_visible, obscured)
+    np.testing.assert_array_equal(game_map.lit_tiles, lit)
+
+
+def free_tiles(game_map):
+    return [
+        (x, y)
+        for x, y in zip(*np.nonzero(game_map.walkable))
+        if not game_map.get_blocking_entity_at_location(x, y)
+    ]
+
+
+def test_incremental_fov_matches_full_recompute(engine):
+    game_map = engine.game_map
+    tiles = free_tiles(game_map)
+    lamp = entity_factories.omnibot.spawn(game_map, *tiles[0])
+    lamp.fighter.base_light = 3
+    engine.update_fov()
+    assert_view_matches_full_recompute(engine)
+
+    for i, (x, y) in enumerate(tiles[1:40:3]):
+        if i % 2:
+            lamp.move_to(*tiles[-1 - i])  # A light source moves.
+        else:
+            engine.player.move_to(int(x), int(y))
+        engine.update_fov()
+        assert_view_matches_full_recompute(engine)
+
+    # Walling in the player changes what both the player and the lights see.
+    px, py = engine.player.x, engine.player.y
+    game_map.set_tile(px + 1, py, tile_types.concrete_wall)
+    engine.update_fov()
+    assert_view_matches_full_recompute(engine)
+
+    # The light goes out.
+    lamp.fighter.base_light = 0
+    engine.update_fov()
+    assert_view_matches_full_recompute(engine)
+
+
+def test_waiting_does_no_fov_work(engine):
+    engine.update_fov()
+    visibility = engine.game_map.visibility
+    assert not visibility.update_player_fov(engine.player.x, engine.player.y, visibility.player_key[2])
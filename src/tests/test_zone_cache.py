@@ -0,0 +1,59 @@
+import os
+
+from zone_cache import ZoneCache
+
+
+class FakeMap:
+    def __init__(self, size):
+        self.size = size
+
+    def estimate_memory(self):
+        return self.size
+
+
+def test_least_recently_used_zones_are_evicted_over_budget():
+    cache = ZoneCache(budget=250)
+    a, b, c = FakeMap(100), FakeMap(100), FakeMap(100)
+    assert cache.put((0, 0), a) == []
+    assert cache.put((0, 1), b) == []
+    assert cache.put((0, 0), a) == []  # Now the most recently used.
+    assert cache.memory == 200
+
+    assert cache.put((0, 2), c) == [((0, 1), b)]
+    assert list(cache.maps) == [(0, 0), (0, 2)]
+    assert cache.memory == 200
+
+    assert cache.pop((0, 0)) is a
+    assert cache.pop((0, 0)) is None
+    assert cache.memory == 100
+
+
+def test_zero_budget_evicts_at_once():
+    cache = ZoneCache(budget=0)
+    game_map = FakeMap(1)
+    assert cache.put((0, 0), game_map) == [((0, 0), game_map)]
+    assert len(cache) == 0 and cache.memory == 0
+
+
+def test_going_back_up_reuses_the_cached_zone(engine):
+    game_map = engine.game_map
+    engine.descend()
+    engine.ascend()
+
+    assert engine.game_map is game_map
+    assert (40, 1) in engine.zone_cache
+    engine.zone_writer.flush()
+    assert not os.path.exists(engine.get_zone_filename((40, 0)))
+
+
+def test_evicted_zones_are_saved_and_loaded_again(engine):
+    engine.zone_cache.budget = engine.game_map.estimate_memory() * 3 // 2  # Room for one zone.
+    first = engine.game_map
+    engine.descend()
+    engine.descend()  # Evicts the first floor.
+
+    assert list(engine.zone_cache.maps) == [(40, 1)]
+    engine.ascend()
+    engine.ascend()
+    assert engine.game_map is not first
+    assert engine.game_map.tiles.tolist() == first.tiles.tolist()
@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+import pytest
+
+from components.ai import ConfusedEnemy, HostileEnemy
+from components.status_effects import Confused
+import entity_factories
+import setup_game
+import tile_types
+from zone_cache import ZoneCache
+import zone_io
+
+
+def new_engine(save_dir):
+    engine = setup_game.new_game(seed=3)
+    engine.save_dir = str(save_dir)
+    engine.zone_cache = ZoneCache(budget=0)  # Every zone left is saved and loaded again.
+    return engine
+
+
+def spawn_confused_monster(engine):
+    game_map = engine.game_map
+    x, y = next(
+        (x, y)
+        for x in range(game_map.width)
+        for y in range(game_map.height)
+        if game_map.walkable[x, y] and not game_map.get_blocking_entity_at_location(x, y)
+    )
+    monster = entity_factories.omnibot.spawn(game_map, x, y)
+    monster.fighter.apply_status_effect(Confused(50))
+    assert isinstance(monster.ai, ConfusedEnemy)
+    return monster
+
+
+def find_at(game_map, x, y, name):
+    return next(actor for actor in game_map.actors if (actor.x, actor.y) == (x, y) and actor.name == name)
+
+
+def test_confused_monster_is_saved_unconfused(tmp_path):
+    engine = new_engine(tmp_path)
+    monster = spawn_confused_monster(engine)
+
+    engine.save_dungeon()
+    engine.load_dungeon()
+
+    loaded = find_at(engine.game_map, monster.x, monster.y, monster.name)
+    assert type(loaded.ai) is HostileEnemy
+    assert not loaded.fighter.status_effects and not any(loaded.fighter.effect_bonuses.values())
+    assert len(engine.status_effects) == 0
+    engine.zone_writer.close()
+
+
+def test_confused_monster_left_behind_on_stairs(tmp_path):
+    engine = new_engine(tmp_path)
+    monster = spawn_confused_monster(engine)
+
+    engine.descend()
+    assert all(effect.target.parent is engine.game_map for effect in engine.status_effects.entries)
+    engine.ascend()
+
+    loaded = find_at(engine.game_map, monster.x, monster.y, monster.name)
+    assert loaded is not monster
+    assert type(loaded.ai) is HostileEnemy
+    assert not loaded.fighter.status_effects
+    engine.zone_writer.close()
+
+
+def get_entity_states(engine):
+    return sorted((entity.x, entity.y, entity.name) for entity in engine.game_map.entities)
+
+
+@pytest.mark.parametrize("codec", ["none", "zlib"])
+def test_much_changed_zone_is_saved_whole(tmp_path, codec):
+    engine = new_engine(tmp_path)
+    engine.zone_codec = codec
+    game_map = engine.game_map
+    game_map.tiles[: game_map.width // 2] = tile_types.concrete_floor
+    game_map.tiles_version += 1
+    tiles, entities = game_map.tiles.copy(), get_entity_states(engine)
+
+    engine.save_dungeon()
+    engine.zone_writer.flush()
+    assert zone_io.snapshot_zone(game_map).magic == zone_io.ZONE_MAGIC
+    engine.load_dungeon()
+
+    assert isinstance(engine.game_map.tiles, np.memmap) == (codec == "none")
+    np.testing.assert_array_equal(engine.game_map.tiles, tiles)
+    assert get_entity_states(engine) == entities
+    assert engine.game_map.origin is None
+
+    engine.save_dungeon()  # Saved whole again, with no generation to diff against.
+    engine.load_dungeon()
+    np.testing.assert_array_equal(engine.game_map.tiles, tiles)
+    assert get_entity_states(engine) == entities
+    engine.zone_writer.close()
+
+
+def test_little_changed_zone_is_saved_as_differences(tmp_path):
+    engine = new_engine(tmp_path)
+    engine.game_map.set_tile(engine.player.x + 1, engine.player.y, tile_types.concrete_wall)
+    assert zone_io.snapshot_zone(engine.game_map).magic == zone_io.DELTA_MAGIC
+
+
+def test_failed_zone_save_is_raised_before_taking_the_stairs(tmp_path, monkeypatch):
+    engine = new_engine(tmp_path)
+    engine.descend()
+    engine.zone_writer.flush()
+
+    def fail(path, snapshot, codec):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(zone_io, "write_zone", fail)
+    engine.ascend()  # The save of the floor below fails in the background.
+    monkeypatch.undo()
+    game_map = engine.game_map
+
+    with pytest.raises(OSError, match="disk full"):
+        engine.descend()
+    assert engine.world_location == [40, 0]
+    assert engine.game_map is game_map and engine.player.parent is game_map
+
+    with pytest.raises(FileNotFoundError):  # The zone never made it to the disk.
+        engine.descend()
+    assert engine.world_location == [40, 0]
+    assert engine.game_map is game_map and engine.player.parent is game_map
+    engine.zone_writer.close()
+
+
+def test_closed_zone_writer_stops_its_thread(tmp_path):
+    engine = new_engine(tmp_path)
+    writer = engine.zone_writer
+    engine.save_dungeon()
+    thread = writer._thread
+    assert writer in zone_io._running_writers
+
+    writer.close()
+    assert not thread.is_alive()
+    assert writer not in zone_io._running_writers
+    assert os.path.exists(engine.get_zone_filename())
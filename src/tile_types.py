@@ -1,7 +1,7 @@
 import color
 from const import *
 
-from typing import Tuple
+from typing import Dict, List, Tuple
 
 import numpy as np  # type: ignore
 
@@ -14,6 +14,12 @@ graphic_dt = np.dtype(
     ]
 )
 
+# The same with alpha, compatible with Console.rgba.
+rgba_graphic_dt = np.dtype([("ch", np.int32), ("fg", "4B"), ("bg", "4B")])
+
+# Maps are grids of tile type ids, the position of the tile type in `registry`.
+tile_id_dt = np.uint8
+
 # Tile struct used for statically defined tile data.
 tile_dt = np.dtype(
     [
@@ -45,16 +51,81 @@ def new_tile(
     obscured: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
     dark: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
     deep: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
-) -> np.ndarray:
-    """Helper function for defining individual tile types """
-    return np.array(
+) -> int:
+    """Helper function for defining individual tile types, returns the id of the new tile type."""
+    registry.append(np.array(
         (tileid, walkable, transparent, not_obscuring, fall_through, stairs_up, stairs_down, light, obscured, dark, deep),
-        dtype=tile_dt)
+        dtype=tile_dt))
+    assert len(registry) <= np.iinfo(tile_id_dt).max + 1, "Too many tile types for tile_id_dt."
+    return len(registry) - 1
 
 
+# Every tile type defined with new_tile, by id.
+registry: List[np.ndarray] = []
+
 # SHROUD represents unexplored, unseen tiles
 SHROUD = np.array((ord(" "), (255, 255, 255), (0, 0, 0)), dtype=graphic_dt)
 
+# How a tile is drawn, see get_graphics_table.
+STATE_LIGHT = 0  # In view and lit up.
+STATE_DARK = 1  # In view but not lit.
+STATE_OBSCURED = 2  # Partially obscured from view.
+STATE_DEEP = 3  # Out of view, remembered.
+STATE_SHROUD = 4  # Never seen.
+NUM_STATES = 5
+
+_graphics_tables: Dict[np.dtype, np.ndarray] = {}
+
+
+def get_graphics_table(rgba: bool = False) -> np.ndarray:
+    """
+    Return the graphics of every tile type in every state, indexed by [tile id, state].
+
+    Flattened, the graphic of a tile in a state is at `id * NUM_STATES + state`.  With `rgba` the
+    table has the dtype of Console.rgba, with opaque colors.
+    """
+    dtype = rgba_graphic_dt if rgba else graphic_dt
+    table = _graphics_tables.get(dtype)
+    if table is None or len(table) != len(registry):
+        table = np.zeros((len(registry), NUM_STATES), dtype=dtype)
+        tiles = get_tile_table()
+        graphics = [tiles["light"], tiles["dark"], tiles["obscured"], tiles["deep"]]
+        for state, graphic in enumerate(graphics + [np.broadcast_to(SHROUD, tiles.shape)]):
+            table["ch"][:, state] = graphic["ch"]
+            table["fg"][:, state, :3] = graphic["fg"]
+            table["bg"][:, state, :3] = graphic["bg"]
+        if rgba:
+            table["fg"][..., 3] = table["bg"][..., 3] = 255
+        _graphics_tables[dtype] = table
+    return table
+
+
+_tile_table = np.zeros(0, dtype=tile_dt)
+_properties: Dict[str, np.ndarray] = {}
+
+
+def get_tile_table() -> np.ndarray:
+    """Return the definition of every tile type as a tile_dt array, indexed by tile id."""
+    global _tile_table
+    if len(_tile_table) != len(registry):
+        _tile_table = np.array(registry, dtype=tile_dt)
+        _properties.clear()
+    return _tile_table
+
+
+def get_property(name: str) -> np.ndarray:
+    """
+    Return a lookup table of one field of tile_dt, such as "walkable", indexed by tile id.
+
+    `get_property("walkable")[tiles]` gives a contiguous array of the property for a grid of tile ids.
+    """
+    table = get_tile_table()
+    lut = _properties.get(name)
+    if lut is None:
+        lut = _properties[name] = np.ascontiguousarray(table[name])
+    return lut
+
+
 # floor tile / open air
 #   transparent=True,
 #   not_obscuring=True,
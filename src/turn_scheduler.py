@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from entity import Actor
+
+
+TURN_LENGTH = 100  # Time units an action takes for an actor of normal (100) speed.
+
+
+def get_action_delay(actor: Actor) -> int:
+    """Return how much time passes between two actions of this actor."""
+    return max(1, TURN_LENGTH * 100 // max(1, actor.fighter.speed))
+
+
+class TurnScheduler:
+    """
+    A priority queue of actors keyed on the time of their next action.
+
+    Only actors whose time has come are popped, so advancing time costs O(k log n) for the k actors
+    acting instead of touching every actor.  Rescheduling an actor leaves its old entry in the heap,
+    it is skipped when popped.
+    """
+
+    def __init__(self) -> None:
+        self.time = 0
+        self.clear()
+
+    def __getstate__(self) -> dict:
+        # The queue refers to the actors of the current map, it's rebuilt when they are next seen.
+        return {"time": self.time}
+
+    def __setstate__(self, state: dict) -> None:
+        self.time = state["time"]
+        self.clear()
+
+    def clear(self) -> None:
+        """Unschedule every actor, keeping the current time."""
+        self.queue: List[Tuple[int, int, Actor]] = []
+        self.entries: Dict[Actor, int] = {}  # actor: sequence number of its live entry
+        self._sequence = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, actor: Actor) -> bool:
+        return actor in self.entries
+
+    def schedule(self, actor: Actor, time: int) -> None:
+        """Schedule the next action of `actor` at `time`, replacing any earlier schedule."""
+        self._sequence += 1
+        self.entries[actor] = self._sequence
+        heapq.heappush(self.queue, (time, self._sequence, actor))
+
+    @property
+    def next_time(self) -> Optional[int]:
+        """The time of the next scheduled action, or None if nothing is scheduled."""
+        self._discard_stale()
+        return self.queue[0][0] if self.queue else None
+
+    def pop_due_batches(self, until: int) -> Iterator[Tuple[int, List[Actor]]]:
+        """Yield (time, actors) for the actions scheduled before `until`, in order, every actor due at
+        the same time together.
+
+        Actors rescheduled while iterating are yielded again if their new time is also due.
+        """
+        while True:
+            self._discard_stale()
+            if not self.queue or self.queue[0][0] >= until:
+                return
+            time = self.queue[0][0]
+            actors = []
+            while self.queue and self.queue[0][0] == time:
+                _, sequence, actor = heapq.heappop(self.queue)
+                if self.entries.get(actor) == sequence:
+                    del self.entries[actor]
+                    actors.append(actor)
+            self.time = max(self.time, time)
+            yield time, actors
+
+    def _discard_stale(self) -> None:
+        queue = self.queue
+        while queue and self.entries.get(queue[0][2]) != queue[0][1]:
+            heapq.heappop(queue)
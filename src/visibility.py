@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+import fov_functions
+from fov_functions import Window
+
+if TYPE_CHECKING:
+    from entity import Entity
+    from game_map import GameMap
+
+
+LightSource = Tuple["Entity", int, int, int]  # entity, x, y, radius
+
+
+class LightContribution:
+    """The cells lit by a single light source, along with the inputs they were computed from."""
+
+    def __init__(self, key: Tuple[int, int, int, int], window: Window, fov: np.ndarray):
+        self.key = key
+        self.window = window
+        self.fov = fov
+
+
+class Visibility:
+    """
+    Keeps the player's field of view and the light grid of a GameMap up to date incrementally.
+
+    Each light source's contribution is cached, keyed on its position, radius and the map's
+    `tiles_version`.  Only sources whose inputs changed are recomputed; `light_counts` holds the number
+    of sources lighting each cell so a stale contribution can be taken away without recomputing the
+    others.
+    """
+
+    def __init__(self, game_map: GameMap):
+        self.game_map = game_map
+        self.player_key: Optional[Tuple[int, int, int, int]] = None
+        self.player_window = fov_functions.EMPTY_WINDOW
+        self.light_counts = np.zeros((game_map.width, game_map.height), dtype=np.uint16)
+        self.lights: Dict[Entity, LightContribution] = {}
+        game_map.lit_tiles[:] = False
+        game_map.mark_dirty()
+
+    def update_player_fov(self, x: int, y: int, radius: int) -> bool:
+        """Recompute the visible and obscured_but_visible arrays if the player's view has changed.
+
+        Returns True if they were recomputed.
+        """
+        game_map = self.game_map
+        key = (x, y, radius, game_map.tiles_version)
+        if key == self.player_key:
+            return False
+        self.player_key = key
+
+        game_map.visible[:] = False
+        window, fov = fov_functions.compute_disk_fov(game_map.transparent, x, y, radius)
+        game_map.visible[window] = fov
+        # compute player's FOV for things that are obscured
+        game_map.obscured_but_visible[:] = False
+        window, fov = fov_functions.compute_disk_fov(game_map.not_obscuring, x, y, radius)
+        game_map.obscured_but_visible[window] = fov & ~game_map.visible[window]
+        # Both views use the same window, nothing outside of the old and new ones changed.
+        game_map.mark_dirty(self.player_window)
+        game_map.mark_dirty(window)
+        self.player_window = window
+        return True
+
+    def update_lights(self, sources: Iterable[LightSource]) -> bool:
+        """Bring the map's light grid up to date with the given light sources.
+
+        Sources which were lit before but are missing now are put out.
+        Returns True if the light grid changed.
+        """
+        game_map = self.game_map
+        dirty: List[Window] = []
+        current = set()
+
+        for source, x, y, radius in sources:
+            current.add(source)
+            key = (x, y, radius, game_map.tiles_version)
+            old = self.lights.get(source)
+            if old is not None:
+                if old.key == key:
+                    continue
+                self._remove(old)
+                dirty.append(old.window)
+            window, fov = fov_functions.compute_disk_fov(game_map.transparent, x, y, radius)
+            self.light_counts[window] += fov
+            self.lights[source] = LightContribution(key, window, fov)
+            dirty.append(window)
+
+        for source in self.lights.keys() - current:
+            old = self.lights.pop(source)
+            self._remove(old)
+            dirty.append(old.window)
+
+        for window in dirty:
+            game_map.lit_tiles[window] = self.light_counts[window] > 0
+            game_map.mark_dirty(window)
+        return bool(dirty)
+
+    def clear_lights(self) -> None:
+        """Forget all light sources and darken the map."""
+        self.lights.clear()
+        self.light_counts[:] = 0
+        self.game_map.lit_tiles[:] = False
+        self.game_map.mark_dirty()
+
+    def _remove(self, contribution: LightContribution) -> None:
+        self.light_counts[contribution.window] -= contribution.fov
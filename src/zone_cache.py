@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+
+ZoneKey = Tuple[int, int]  # world location (x, y)
+
+DEFAULT_BUDGET = 8 * 1024 * 1024  # bytes
+
+
+class ZoneCache:
+    """
+    The maps of recently visited zones, kept live so going back to one skips saving and loading it.
+
+    Once the estimated memory of the maps goes over `budget` bytes the least recently used ones are
+    evicted, it's up to the caller to save them then.  A budget of 0 disables the cache.
+    """
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        self.budget = budget
+        self.maps: OrderedDict[ZoneKey, GameMap] = OrderedDict()
+        self.sizes: Dict[ZoneKey, int] = {}
+        self.memory = 0
+
+    def __len__(self) -> int:
+        return len(self.maps)
+
+    def __contains__(self, key: ZoneKey) -> bool:
+        return key in self.maps
+
+    def items(self) -> Iterator[Tuple[ZoneKey, GameMap]]:
+        return iter(list(self.maps.items()))
+
+    def put(self, key: ZoneKey, game_map: GameMap) -> List[Tuple[ZoneKey, GameMap]]:
+        """Keep the map of a zone being left, and return the (key, map) of every zone evicted for it."""
+        self.pop(key)
+        self.maps[key] = game_map
+        self.sizes[key] = game_map.estimate_memory()
+        self.memory += self.sizes[key]
+        evicted = []
+        while self.memory > self.budget and self.maps:
+            evicted_key, evicted_map = self.maps.popitem(last=False)
+            self.memory -= self.sizes.pop(evicted_key)
+            evicted.append((evicted_key, evicted_map))
+        return evicted
+
+    def pop(self, key: ZoneKey) -> Optional[GameMap]:
+        """Take the map of a zone being entered out of the cache, if it's there."""
+        game_map = self.maps.pop(key, None)
+        if game_map is not None:
+            self.memory -= self.sizes.pop(key)
+        return game_map
@@ -0,0 +1,479 @@
+"""
+The zone save formats.
+
+Zones made by procgen are saved as their differences from what generation gives: the tiles changed
+since, the player's memory and explored mask, and the entities which were removed, changed or added.
+Loading generates the zone again from its seed and applies them, see procgen.regenerate_dungeon.
+
+Other maps are saved whole, but only their authoritative layers: the tiles, the player's memory of
+them and the explored mask, with their entities.  Everything derived from them, such as what is lit
+or visible, is recomputed once the zone is played again.  So are zones made by procgen whose tiles
+changed so much that their differences would take more room than the layers themselves, they are
+saved whole from then on.
+
+Either file is a header, a table of blocks, then the blocks themselves, each starting on an
+ALIGNMENT boundary.  A whole map saved with the "none" codec has its tile layers stored raw, they
+are memory-mapped copy-on-write when loaded instead of being read.
+
+Saving is split in two: snapshot_zone serializes the map into a ZoneSnapshot right away, then
+write_zone compresses and writes it, usually later on the ZoneWriter's thread.
+"""
+from __future__ import annotations
+
+import atexit
+import io
+import lzma
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Entity
+    from game_map import GameMap
+
+
+ZONE_MAGIC = b"SNZ\0"  # A whole map.
+DELTA_MAGIC = b"SND\0"  # The differences of a generated map from its regenerated baseline.
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+HEADER = struct.Struct("<4sHHIII")  # magic, version, codec, width, height, number of blocks
+BLOCK = struct.Struct("<16s8sQQQ")  # name, dtype, offset, stored size, raw size
+
+# name: (compress, decompress).  Codecs are stored by their position in CODEC_NAMES, only append.
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "none": (bytes, bytes),
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+CODEC_NAMES = ("none", "zlib", "lzma")
+DEFAULT_CODEC = "zlib"
+
+# Array layers of whole maps, in the order they are stored.  Packed layers are stored with np.packbits.
+TILE_LAYERS = ("tiles", "tiles_memory")
+PACKED_LAYERS = ("explored",)
+# Arrays which are recomputed instead of being stored, see GameMap.reset_view_arrays.
+DERIVED_LAYERS = ("lit_tiles", "obscured_but_visible", "lit_and_visible", "visible")
+# What a map remembers of its generation, which is never stored: it's generated again on load.
+BASELINE_ATTRIBUTES = ("generated_tiles", "generated_entities")
+# A changed tile takes 5 bytes as a difference (a uint32 index and the tile id) and a cell of a raw
+# layer 1, so a map with more than this fraction of its tiles changed is smaller saved whole.
+WHOLE_SAVE_FRACTION = 0.2
+
+Blocks = List[Tuple[str, str, bytes]]  # name, dtype, data
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class ZoneSnapshot:
+    """The uncompressed blocks of a zone file, serialized from a map and ready to be written."""
+
+    def __init__(self, magic: bytes, width: int, height: int, blocks: Blocks):
+        self.magic = magic
+        self.width = width
+        self.height = height
+        self.blocks = blocks
+
+
+def write_zone(path: str, snapshot: ZoneSnapshot, codec: str = DEFAULT_CODEC) -> int:
+    """Write a snapshot to `path` and return the size of the file.
+
+    Only touches the snapshot, so it's safe to call on another thread while the game goes on.
+    """
+    compress = CODECS[codec][0]
+    table = []
+    offset = _align(HEADER.size + BLOCK.size * len(snapshot.blocks))
+    for name, dtype, data in snapshot.blocks:
+        assert len(name) <= 16, "Block names are stored in 16 bytes."
+        stored = compress(data)
+        table.append((name, dtype, offset, stored, len(data)))
+        offset = _align(offset + len(stored))
+
+    # Written next to the old file and then swapped in, so a failed save never leaves half a zone.
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(
+            snapshot.magic, FORMAT_VERSION, CODEC_NAMES.index(codec), snapshot.width, snapshot.height, len(table)
+        ))
+        for name, dtype, block_offset, stored, raw_size in table:
+            f.write(BLOCK.pack(name.encode(), dtype.encode(), block_offset, len(stored), raw_size))
+        for _, _, block_offset, stored, _ in table:
+            f.seek(block_offset)
+            f.write(stored)
+        size = f.tell()
+    os.replace(temp_path, path)
+    return size
+
+
+class _BlockReader:
+    """Reads the header and block table of a zone file, then its blocks on request."""
+
+    def __init__(self, path: str, f: BinaryIO):
+        self.path = path
+        self.file = f
+        self.magic, version, codec_index, self.width, self.height, count = HEADER.unpack(f.read(HEADER.size))
+        if self.magic not in (ZONE_MAGIC, DELTA_MAGIC):
+            raise ValueError(f"{path} is not a zone file.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has zone format version {version}, expected {FORMAT_VERSION}.")
+        self.codec = CODEC_NAMES[codec_index]
+        self.table: Dict[str, Tuple[str, int, int]] = {}  # name: (dtype, offset, stored size)
+        for _ in range(count):
+            name, dtype, offset, size, _ = BLOCK.unpack(f.read(BLOCK.size))
+            self.table[name.rstrip(b"\0").decode()] = (dtype.rstrip(b"\0").decode(), offset, size)
+
+    def read(self, name: str) -> bytes:
+        _, offset, size = self.table[name]
+        self.file.seek(offset)
+        return CODECS[self.codec][1](self.file.read(size))
+
+    def read_array(self, name: str) -> np.ndarray:
+        return np.frombuffer(self.read(name), dtype=np.dtype(self.table[name][0])).copy()
+
+    def read_packed(self, name: str) -> np.ndarray:
+        return _unpack(self.read(name), self.width, self.height)
+
+    def map_array(self, name: str) -> np.ndarray:
+        """Return a (width, height) layer, memory-mapped if it is stored raw."""
+        dtype, offset, _ = self.table[name]
+        shape = (self.width, self.height)
+        if self.codec == "none":
+            return np.memmap(self.path, dtype=np.dtype(dtype), mode="c", offset=offset, shape=shape)
+        return self.read_array(name).reshape(shape)
+
+
+def _unpack(data: bytes, width: int, height: int) -> np.ndarray:
+    """Return a (width, height) bool array from bits packed by np.packbits."""
+    bits = np.frombuffer(data, dtype=np.uint8)
+    return np.unpackbits(bits, count=width * height).reshape(width, height).view(bool)
+
+
+def _get_small_state(game_map: GameMap) -> Dict[str, Any]:
+    """Return the pickled state of a map without its arrays, entities and engine."""
+    state = game_map.__getstate__()
+    for name in TILE_LAYERS + PACKED_LAYERS + DERIVED_LAYERS + BASELINE_ATTRIBUTES:
+        state.pop(name, None)
+    state.pop("_entities", None)
+    state.pop("engine", None)
+    return state
+
+
+def _detach_mapped_layers(game_map: GameMap) -> None:
+    """Read any layers mapped from a zone file into memory, so the file can be replaced."""
+    for name in TILE_LAYERS:
+        array = getattr(game_map, name)
+        if isinstance(array, np.memmap):
+            setattr(game_map, name, np.array(array))
+
+
+def snapshot_zone(game_map: GameMap) -> ZoneSnapshot:
+    """Serialize a map for write_zone, as its differences from its generation if procgen made it.
+
+    Maps with no generation to go back to, or too changed from it, are saved whole with their entities.
+    """
+    if game_map.origin is not None:
+        changed = np.count_nonzero(game_map.tiles != game_map.generated_tiles)
+        if changed <= game_map.tiles.size * WHOLE_SAVE_FRACTION:
+            return _snapshot_delta(game_map)
+    snapshot = _snapshot_whole(game_map)
+    if game_map.engine is not None:
+        player = game_map.engine.player
+        pickles = _pickle_entities(game_map, (entity for entity in game_map.entities if entity is not player))
+        snapshot.blocks.append(("entities", "", b"".join(pickles.values())))
+    return snapshot
+
+
+def _snapshot_whole(game_map: GameMap) -> ZoneSnapshot:
+    """Serialize the whole map, without its entities."""
+    blocks: Blocks = [("state", "", pickle.dumps(_get_small_state(game_map)))]
+    for name in TILE_LAYERS:
+        array = np.ascontiguousarray(getattr(game_map, name))
+        blocks.append((name, array.dtype.str, array.tobytes()))
+    for name in PACKED_LAYERS:
+        blocks.append((name, "|b1", np.packbits(getattr(game_map, name), axis=None).tobytes()))
+    _detach_mapped_layers(game_map)
+    return ZoneSnapshot(ZONE_MAGIC, game_map.width, game_map.height, blocks)
+
+
+class _EntityPickler(pickle.Pickler):
+    """Pickles entities without the map, engine and player they refer to, see _EntityUnpickler."""
+
+    def __init__(self, file: BinaryIO, game_map: GameMap):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.shared = {id(game_map): "map", id(game_map.engine): "engine", id(game_map.engine.player): "player"}
+
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        return self.shared.get(id(obj))
+
+
+class _EntityUnpickler(pickle.Unpickler):
+    def __init__(self, file: BinaryIO, game_map: GameMap):
+        super().__init__(file)
+        self.shared = {"map": game_map, "engine": game_map.engine, "player": game_map.engine.player}
+
+    def persistent_load(self, pid: str) -> Any:
+        return self.shared[pid]
+
+
+def _pickle_entities(game_map: GameMap, entities: Iterable[Entity]) -> Dict[Entity, bytes]:
+    """Pickle each entity on its own, the pickles can be concatenated and read back one by one."""
+    pickles = {}
+    for entity in entities:
+        f = io.BytesIO()
+        _EntityPickler(f, game_map).dump(entity)
+        pickles[entity] = f.getvalue()
+    return pickles
+
+
+def _unpickle_entities(game_map: GameMap, data: bytes) -> List[Entity]:
+    """Return the entities pickled one after the other by _pickle_entities."""
+    stream = io.BytesIO(data)
+    entities = []
+    while stream.tell() < len(data):
+        # A new unpickler for each entity, their memos would clash.
+        entities.append(_EntityUnpickler(stream, game_map).load())
+    return entities
+
+
+def get_entity_fingerprints(game_map: GameMap, entities: List[Entity]) -> List[int]:
+    """Return a checksum of the state of each entity, to tell which ones changed since."""
+    pickles = _pickle_entities(game_map, entities)
+    return [zlib.crc32(pickles[entity]) for entity in entities]
+
+
+def _get_remembered_baseline(game_map: GameMap) -> np.ndarray:
+    """What the player's memory of the map would be if they remembered exactly what they explored."""
+    return np.where(game_map.explored, game_map.tiles, game_map.tiles_memory.dtype.type(game_map.default_fill))
+
+
+def _diff_blocks(name: str, array: np.ndarray, baseline: np.ndarray) -> Blocks:
+    """Return the cells where `array` differs from `baseline`, as blocks of flat indices and values."""
+    index = np.flatnonzero(array != baseline).astype(np.uint32)
+    values = array.ravel()[index]
+    return [(name + "_index", index.dtype.str, index.tobytes()), (name, values.dtype.str, values.tobytes())]
+
+
+def _apply_diff(reader: _BlockReader, name: str, array: np.ndarray) -> None:
+    array.ravel()[reader.read_array(name + "_index")] = reader.read_array(name)
+
+
+def _snapshot_delta(game_map: GameMap) -> ZoneSnapshot:
+    """Serialize a map made by procgen as its differences from its generation, with its entities.
+
+    The map needs its engine attached.
+    """
+    player = game_map.engine.player
+    live = game_map.entities
+    # Every entity is pickled once, both to tell whether it changed and to be saved if it did.
+    pickles = _pickle_entities(game_map, (entity for entity in live if entity is not player))
+    unchanged = set()
+    removed = []
+    for i, (entity, generated) in enumerate(game_map.generated_entities):
+        if entity in pickles and zlib.crc32(pickles[entity]) == generated:
+            unchanged.add(entity)
+        else:
+            removed.append(i)
+    added = b"".join(data for entity, data in pickles.items() if entity not in unchanged)
+    removed_array = np.array(removed, dtype=np.uint32)
+
+    blocks: Blocks = [("state", "", pickle.dumps(_get_small_state(game_map)))]
+    blocks += _diff_blocks("tiles", game_map.tiles, game_map.generated_tiles)
+    blocks += _diff_blocks("memory", game_map.tiles_memory, _get_remembered_baseline(game_map))
+    blocks.append(("explored", "|b1", np.packbits(game_map.explored, axis=None).tobytes()))
+    blocks.append(("removed", removed_array.dtype.str, removed_array.tobytes()))
+    blocks.append(("entities", "", added))
+    return ZoneSnapshot(DELTA_MAGIC, game_map.width, game_map.height, blocks)
+
+
+def read_zone(
+    path: str,
+    regenerate: Optional[Callable[[Tuple[int, int, int]], GameMap]] = None,
+    engine: Optional[Engine] = None,
+) -> GameMap:
+    """Load a map written by write_zone.
+
+    Maps saved whole get `engine` and their entities attached, or neither without an engine.  Maps
+    saved as differences are rebuilt on the map returned by `regenerate(origin)`, with its engine
+    and entities.
+    """
+    from game_map import GameMap
+
+    with open(path, "rb") as f:
+        reader = _BlockReader(path, f)
+        state = pickle.loads(reader.read("state"))
+
+        if reader.magic == ZONE_MAGIC:
+            game_map = GameMap.__new__(GameMap)
+            game_map.__dict__.update(state)
+            # Its generation wasn't saved, so it's saved whole from now on.
+            game_map.origin = None
+            game_map.generated_tiles = None
+            game_map.generated_entities = []
+            game_map.engine = engine
+            game_map.entities = ()
+            for name in TILE_LAYERS:
+                setattr(game_map, name, reader.map_array(name))
+            game_map.explored = reader.read_packed("explored")
+            game_map.reset_view_arrays()
+            if engine is not None and "entities" in reader.table:
+                for entity in _unpickle_entities(game_map, reader.read("entities")):
+                    game_map.add_entity(entity)
+            return game_map
+
+        if regenerate is None:
+            raise ValueError(f"{path} needs its zone to be generated again to be loaded.")
+        game_map = regenerate(state["origin"])
+        game_map.__dict__.update(state)
+        _apply_diff(reader, "tiles", game_map.tiles)
+        game_map.tiles_version += 1
+        game_map.explored = reader.read_packed("explored")
+        game_map.tiles_memory = _get_remembered_baseline(game_map)
+        _apply_diff(reader, "memory", game_map.tiles_memory)
+
+        baseline = game_map.generated_entities
+        for i in reader.read_array("removed"):
+            game_map.remove_entity(baseline[i][0])
+        for entity in _unpickle_entities(game_map, reader.read("entities")):
+            game_map.add_entity(entity)
+    return game_map
+
+
+def snapshot_generated(game_map: GameMap) -> ZoneSnapshot:
+    """Serialize a map just made by procgen with its entities, to hand it over from a worker process."""
+    snapshot = _snapshot_whole(game_map)
+    entities = [entity for entity, _ in game_map.generated_entities]
+    pickles = _pickle_entities(game_map, entities)
+    fingerprints = np.array([fingerprint for _, fingerprint in game_map.generated_entities], dtype=np.uint32)
+    snapshot.blocks.append(("entities", "", b"".join(pickles[entity] for entity in entities)))
+    snapshot.blocks.append(("fingerprints", fingerprints.dtype.str, fingerprints.tobytes()))
+    return snapshot
+
+
+def read_generated(snapshot: ZoneSnapshot, engine: Engine) -> GameMap:
+    """Return the map serialized by snapshot_generated, with `engine` and its entities attached.
+
+    The player isn't on it yet.
+    """
+    from game_map import GameMap
+
+    blocks = {name: (dtype, data) for name, dtype, data in snapshot.blocks}
+    shape = (snapshot.width, snapshot.height)
+    game_map = GameMap.__new__(GameMap)
+    game_map.__dict__.update(pickle.loads(blocks["state"][1]))
+    game_map.engine = engine
+    game_map.entities = ()
+    for name in TILE_LAYERS:
+        dtype, data = blocks[name]
+        setattr(game_map, name, np.frombuffer(data, dtype=np.dtype(dtype)).reshape(shape).copy())
+    game_map.explored = _unpack(blocks["explored"][1], *shape)
+    game_map.reset_view_arrays()
+
+    game_map.generated_tiles = game_map.tiles.copy()
+    entities = _unpickle_entities(game_map, blocks["entities"][1])
+    for entity in entities:
+        game_map.add_entity(entity)
+    fingerprints = np.frombuffer(blocks["fingerprints"][1], dtype=np.uint32).tolist()
+    game_map.generated_entities = list(zip(entities, fingerprints))
+    return game_map
+
+
+class ZoneWriter:
+    """
+    Writes zone snapshots on a background thread, so leaving a zone doesn't wait on the disk.
+
+    A snapshot still waiting to be written is replaced by a newer one of the same file.  Errors are
+    kept, and raised on the main thread by the next flush which covers the file.  The thread runs
+    from the first save until close, writers still running at exit are flushed first.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[str, Tuple[ZoneSnapshot, str]] = {}  # path: (snapshot, codec)
+        self._writing: Optional[str] = None
+        self._errors: Dict[str, Exception] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+
+    def save(self, path: str, snapshot: ZoneSnapshot, codec: str = DEFAULT_CODEC) -> None:
+        """Queue the snapshot to be written to `path`."""
+        with self._condition:
+            self._pending[path] = (snapshot, codec)
+            self._condition.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ZoneWriter", daemon=True)
+                self._thread.start()
+                _running_writers.add(self)
+
+    def _is_busy(self, path: Optional[str]) -> bool:
+        if path is None:
+            return bool(self._pending) or self._writing is not None
+        return path in self._pending or self._writing == path
+
+    def flush(self, path: Optional[str] = None) -> None:
+        """Wait until the pending snapshot of `path`, or every pending snapshot, is written.
+
+        Raises the error of a failed write, once.
+        """
+        with self._condition:
+            while self._is_busy(path):
+                self._condition.wait()
+            if path is None:
+                errors = list(self._errors.values())
+                self._errors.clear()
+            else:
+                errors = [self._errors.pop(path)] if path in self._errors else []
+        if errors:
+            raise errors[0]
+
+    def close(self) -> None:
+        """Write every pending snapshot, then stop the thread.  Raises the error of a failed write, as flush."""
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._closing = True
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join()
+        self._closing = False
+        _running_writers.discard(self)
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closing:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                path = next(iter(self._pending))
+                snapshot, codec = self._pending.pop(path)
+                self._writing = path
+            error = None
+            try:
+                write_zone(path, snapshot, codec)
+            except Exception as exc:
+                error = exc
+            with self._condition:
+                self._writing = None
+                if error is None:
+                    self._errors.pop(path, None)
+                else:
+                    self._errors[path] = error
+                self._condition.notify_all()
+
+
+# Writers with a thread running.  Daemon threads are killed at exit, so they finish writing first.
+_running_writers: Set[ZoneWriter] = set()
+
+
+@atexit.register
+def _flush_running_writers() -> None:
+    for writer in list(_running_writers):
+        writer.flush()